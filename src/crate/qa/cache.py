@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import functools
+import subprocess
+from typing import Any, Callable, Dict, Optional
+
+
+CACHE_DIR = os.environ.get(
+    'CRATE_QA_CACHE_DIR',
+    os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'crate-qa'))
+JAVA_VERSION_RE = re.compile(r'version "(?P<version>[^"]+)"')
+
+# Lock files older than this are considered to be left over by a crashed run
+STALE_LOCK_SECONDS = 3600
+
+
+def java_executable(crate_dir: str, java_home: Optional[str]) -> str:
+    """Return the java executable that is used to run the given CrateDB."""
+    bundled = os.path.join(crate_dir, 'jdk', 'bin', 'java')
+    if os.path.exists(bundled):
+        return bundled
+    if java_home:
+        return os.path.join(java_home, 'bin', 'java')
+    return 'java'
+
+
+@functools.lru_cache()
+def java_version(java: str) -> Optional[str]:
+    """Return the full version string of the given java executable."""
+    try:
+        p = subprocess.run([java, '-version'],
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT,
+                           universal_newlines=True)
+    except OSError:
+        return None
+    m = JAVA_VERSION_RE.search(p.stdout)
+    return m.group('version') if m else None
+
+
+def java_major_version(version: str) -> int:
+    """Return the major version of a java version string.
+
+    >>> java_major_version('1.8.0_202')
+    8
+    >>> java_major_version('13.0.1')
+    13
+    """
+    parts = version.split('.')
+    if parts[0] == '1':
+        return int(parts[1])
+    return int(re.match(r'\d+', parts[0]).group(0))
+
+
+def _try_lock(path: str) -> bool:
+    try:
+        if time.time() - os.stat(path).st_mtime > STALE_LOCK_SECONDS:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        return False
+
+
+class CdsArchive:
+    """Class data sharing (AppCDS) archive of a CrateDB build.
+
+    The archive is keyed by the CrateDB build and the full java version.
+    If the archive doesn't exist yet, the first node that is started with
+    `java_opts` dumps its loaded classes into a temporary archive when the
+    JVM exits (requires Java 13 or later). `commit` moves it into the cache
+    after the node has been stopped, so all further nodes of that build
+    start with the archive.
+    """
+
+    def __init__(self, crate_dir: str, java_home: Optional[str]):
+        java = java_executable(crate_dir, java_home)
+        self.java_version = java_version(java)
+        key = f'{os.path.basename(crate_dir.rstrip(os.sep))}-java-{self.java_version}'
+        self.path = os.path.join(CACHE_DIR, 'cds', re.sub(r'[^\w.+-]', '_', key) + '.jsa')
+        self._tmp: Optional[str] = None
+
+    def java_opts(self) -> str:
+        if not self.java_version:
+            return ''
+        if os.path.exists(self.path):
+            return f'-XX:SharedArchiveFile={self.path}'
+        if java_major_version(self.java_version) < 13:
+            return ''
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if not _try_lock(self.path + '.lock'):
+            # another node is creating the archive
+            return ''
+        self._tmp = f'{self.path}.{os.getpid()}.{id(self)}.tmp'
+        return f'-XX:ArchiveClassesAtExit={self._tmp}'
+
+    def commit(self, complete=True):
+        """Move an archive that was dumped on exit into the cache.
+
+        If the JVM didn't exit normally (`complete` is false), the archive
+        may be incomplete and is discarded.
+        """
+        if not self._tmp:
+            return
+        if os.path.exists(self._tmp):
+            if complete:
+                os.replace(self._tmp, self.path)
+            else:
+                os.remove(self._tmp)
+        if os.path.exists(self.path + '.lock'):
+            os.remove(self.path + '.lock')
+
+
+# Directories of a CrateDB data path whose files are never modified after
+# they have been written: Lucene segments and blobs.
+IMMUTABLE_DIRS = ('index', 'blobs')
+
+
+def copy_tree(src: str, dst: str):
+    """Copy a CrateDB data directory.
+
+    Files below one of the `IMMUTABLE_DIRS` are hard linked if possible,
+    because CrateDB only ever creates and deletes them. All other files, like
+    the translog and the cluster state, are copied.
+    """
+    for root, dirs, files in os.walk(src):
+        rel = os.path.relpath(root, src)
+        target = os.path.normpath(os.path.join(dst, rel))
+        os.makedirs(target, exist_ok=True)
+        immutable = any(d in IMMUTABLE_DIRS for d in rel.split(os.sep))
+        for name in files:
+            src_file = os.path.join(root, name)
+            dst_file = os.path.join(target, name)
+            if immutable and name != 'write.lock':
+                try:
+                    os.link(src_file, dst_file)
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(src_file, dst_file)
+
+
+def publish_dir(path: str, populate: Callable[[str], None]):
+    """Create the directory `path` atomically.
+
+    `populate` is called with a temporary directory next to `path`, which is
+    renamed to `path` afterwards, so that readers never see a partially
+    written directory. If another run has published `path` concurrently,
+    its directory is kept and ours is discarded; all other errors are raised.
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(path) + '.tmp-')
+    try:
+        populate(tmp)
+        os.rename(tmp, path)
+    except OSError:
+        if not os.path.exists(path):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+class SnapshotCache:
+    """Cache of seeded data directories.
+
+    A snapshot is stored under a key that must identify the CrateDB build
+    that created the data and the fixture that was used to create it,
+    together with JSON serializable metadata.
+    """
+
+    def __init__(self, root=os.path.join(CACHE_DIR, 'snapshots')):
+        self.root = root
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        data = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def restore(self, key: str, data_path: str) -> Optional[Dict[str, Any]]:
+        """Copy the snapshot into `data_path` and return its metadata.
+
+        Returns `None` if there is no snapshot for the key.
+        """
+        path = os.path.join(self.root, key)
+        try:
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        copy_tree(os.path.join(path, 'data'), data_path)
+        return meta
+
+    def store(self, key: str, data_path: str, meta: Dict[str, Any]):
+        def populate(tmp):
+            copy_tree(data_path, os.path.join(tmp, 'data'))
+            with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+        try:
+            publish_dir(os.path.join(self.root, key), populate)
+        except OSError:
+            # the snapshot is only an optimization, e.g. running out of disk
+            # space must not fail the test
+            pass
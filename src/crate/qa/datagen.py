@@ -0,0 +1,182 @@
+import re
+import uuid
+import string
+from random import Random
+from typing import Any, Callable, Dict, List, Tuple
+
+
+# Timestamps are generated relative to a fixed point in time (2020-01-01) so
+# that the generated data only depends on the seed
+REFERENCE_TIME_MS = 1577836800000
+TWO_YEARS_MS = 2 * 365 * 24 * 60 * 60 * 1000
+VOCABULARY_SIZE = 1000
+MAX_ARRAY_LENGTH = 5
+# Maximum width and height of generated polygons in degrees
+MAX_SHAPE_SIZE = 1.0
+
+ColumnGenerator = Callable[[Random, int, int], List[Any]]
+
+
+def _ints(lo: int, hi: int) -> ColumnGenerator:
+    span = hi - lo + 1
+    bits = span.bit_length()
+
+    def gen(rng, n, offset):
+        randbits = rng.getrandbits
+        values = []
+        while len(values) < n:
+            values.extend(x + lo for x in (randbits(bits) for _ in range(n - len(values))) if x < span)
+        return values
+    return gen
+
+
+def _floats(scale: float) -> ColumnGenerator:
+    def gen(rng, n, offset):
+        r = rng.random
+        return [(r() - 0.5) * 2 * scale for _ in range(n)]
+    return gen
+
+
+def _booleans(rng, n, offset):
+    bits = rng.getrandbits(n) if n else 0
+    return [bool(bits >> i & 1) for i in range(n)]
+
+
+def _timestamps(rng, n, offset):
+    return _ints(REFERENCE_TIME_MS - TWO_YEARS_MS, REFERENCE_TIME_MS)(rng, n, offset)
+
+
+def _ips(rng, n, offset):
+    randbits = rng.getrandbits
+    return [f'{x >> 24}.{x >> 16 & 255}.{x >> 8 & 255}.{x & 255}'
+            for x in (randbits(32) for _ in range(n))]
+
+
+def _words(vocabulary: List[str]) -> ColumnGenerator:
+    def gen(rng, n, offset):
+        return rng.choices(vocabulary, k=n)
+    return gen
+
+
+def _geo_points(rng, n, offset):
+    r = rng.random
+    return [[r() * 360 - 180, r() * 180 - 90] for _ in range(n)]
+
+
+def _geo_shapes(rng, n, offset):
+    shapes = []
+    for lon, lat in _geo_points(rng, n, offset):
+        # keep the whole polygon within the valid coordinate range
+        lon, lat = min(lon, 180 - MAX_SHAPE_SIZE), min(lat, 90 - MAX_SHAPE_SIZE)
+        d = rng.random() * (MAX_SHAPE_SIZE - 0.01) + 0.01
+        shapes.append(f'POLYGON (({lon} {lat}, {lon + d} {lat}, {lon + d} {lat + d}, '
+                      f'{lon} {lat + d}, {lon} {lat}))')
+    return shapes
+
+
+def _objects(rng, n, offset):
+    return [{} for _ in range(n)]
+
+
+def _sequence(rng, n, offset):
+    return list(range(offset + 1, offset + n + 1))
+
+
+def _uuids(rng, n, offset):
+    randbits = rng.getrandbits
+    return [str(uuid.UUID(int=randbits(128), version=4)) for _ in range(n)]
+
+
+def _arrays(inner: ColumnGenerator, dimensions: int) -> ColumnGenerator:
+    def gen(rng, n, offset):
+        lengths = _ints(0, MAX_ARRAY_LENGTH)(rng, n, offset)
+        values = inner(rng, sum(lengths), offset) if dimensions == 1 \
+            else _arrays(inner, dimensions - 1)(rng, sum(lengths), offset)
+        arrays = []
+        start = 0
+        for length in lengths:
+            arrays.append(values[start:start + length])
+            start += length
+        return arrays
+    return gen
+
+
+ARRAY_TYPE_RE = re.compile(r'^array\((?P<inner>.+)\)$')
+
+
+class RowGenerator:
+    """Generates rows for the columns of a table, a whole column at a time.
+
+    `columns` maps column names to the data types as returned by
+    `columns_for_table`. All values are drawn from a random generator that
+    is seeded with `seed`, so two generators with the same columns and seed
+    generate the same rows if `generate` is called with the same numbers of
+    rows. ``id`` columns of integer types are sequences that continue across
+    calls of `generate`, ``id`` columns of string type are UUIDs.
+    """
+
+    def __init__(self, columns: Dict[str, str], seed=0):
+        self._rng = Random(seed)
+        self._offset = 0
+        vocab_rng = Random(seed)
+        self._vocabulary = [
+            ''.join(vocab_rng.choices(string.ascii_lowercase, k=vocab_rng.randint(3, 10)))
+            for _ in range(VOCABULARY_SIZE)
+        ]
+        self._generators = [self._generator(name, data_type)
+                            for name, data_type in columns.items()]
+
+    def _type_generators(self) -> Dict[str, ColumnGenerator]:
+        byte = _ints(-128, 127)
+        short = _ints(-32768, 32767)
+        integer = _ints(-2 ** 31, 2 ** 31 - 1)
+        long = _ints(-2 ** 63, 2 ** 63 - 1)
+        words = _words(self._vocabulary)
+        return {
+            'byte': byte,
+            'char': byte,
+            'short': short,
+            'smallint': short,
+            'integer': integer,
+            'int': integer,
+            'long': long,
+            'bigint': long,
+            'float': _floats(1e6),
+            'real': _floats(1e6),
+            'double': _floats(1e9),
+            'double precision': _floats(1e9),
+            'ip': _ips,
+            'timestamp': _timestamps,
+            'timestamp with time zone': _timestamps,
+            'timestamp without time zone': _timestamps,
+            'string': words,
+            'text': words,
+            'boolean': _booleans,
+            'geo_point': _geo_points,
+            'geo_shape': _geo_shapes,
+            'object': _objects,
+        }
+
+    def _generator(self, name: str, data_type: str) -> ColumnGenerator:
+        if name == 'id' and data_type in ('integer', 'int', 'long', 'bigint'):
+            return _sequence
+        if name == 'id' and data_type in ('string', 'text'):
+            return _uuids
+        inner, dimensions = data_type, 0
+        while True:
+            m = ARRAY_TYPE_RE.match(inner)
+            if m:
+                inner, dimensions = m.group('inner'), dimensions + 1
+            elif inner.endswith('_array'):
+                inner, dimensions = inner[:-len('_array')], dimensions + 1
+            else:
+                break
+        generator = self._type_generators().get(inner)
+        if not generator:
+            raise ValueError(f'No generator found for column "{name}" with type "{data_type}"')
+        return _arrays(generator, dimensions) if dimensions else generator
+
+    def generate(self, num_rows: int) -> List[Tuple[Any, ...]]:
+        columns = [gen(self._rng, num_rows, self._offset) for gen in self._generators]
+        self._offset += num_rows
+        return list(zip(*columns))
@@ -0,0 +1,43 @@
+import os
+import gzip
+import json
+from typing import Dict
+from crate.qa.cache import CACHE_DIR, SnapshotCache, publish_dir
+from crate.qa.datagen import RowGenerator
+
+# Part of the key of every fixture, increment it if `RowGenerator`
+# generates different data for the same seed
+FORMAT_VERSION = 2
+
+
+class FixtureStore:
+    """Store of generated datasets as gzip compressed JSON lines files.
+
+    A dataset is identified by the columns it is generated for, the number
+    of rows and the seed of the `RowGenerator`. It is written once into a
+    directory of `files` files, so that it can be imported by multiple
+    nodes in parallel with ``COPY FROM``.
+    """
+
+    def __init__(self, root=os.path.join(CACHE_DIR, 'fixtures')):
+        self.root = root
+
+    def path(self, columns: Dict[str, str], num_rows: int, seed: int, files=4) -> str:
+        """Return the directory of the dataset, generating it if it doesn't exist."""
+        key = SnapshotCache.key(FORMAT_VERSION, list(columns.items()), num_rows, seed, files)
+        path = os.path.join(self.root, key)
+        if not os.path.exists(path):
+            publish_dir(path, lambda tmp: self._generate(tmp, columns, num_rows, seed, files))
+        return path
+
+    def _generate(self, path, columns, num_rows, seed, files, bulk_size=10000):
+        rows = RowGenerator(columns, seed)
+        names = list(columns.keys())
+        per_file = -(-num_rows // files)
+        for part in range(files):
+            remaining = min(per_file, num_rows - part * per_file)
+            with gzip.open(os.path.join(path, f'part-{part}.json.gz'), 'wt', encoding='utf-8') as f:
+                while remaining > 0:
+                    for row in rows.generate(min(bulk_size, remaining)):
+                        f.write(json.dumps(dict(zip(names, row))) + '\n')
+                    remaining -= bulk_size
@@ -0,0 +1,282 @@
+import os
+import re
+import gzip
+import time
+from collections import deque, OrderedDict
+from threading import Lock
+from typing import List, Tuple, Dict, NamedTuple, Optional
+from cr8.run_crate import AddrConsumer
+
+
+# (kind, pattern) of log messages after which a starting node won't become
+# ready anymore
+FATAL_PATTERNS = [
+    ('startup', re.compile(
+        r'uncaught exception in thread \[main\]'
+        r'|Exception in thread "main"'
+        r'|unknown setting \['
+        r'|bootstrap checks failed'
+        r'|SettingsException'
+        r'|^\s*(Caused by: )?java\.lang\.OutOfMemoryError'
+        r'|Exception in thread "[^"]*" java\.lang\.OutOfMemoryError')),
+    ('bind', re.compile(
+        r'BindTransportException'
+        r'|BindHttpException'
+        r'|java\.net\.BindException'
+        r'|Address already in use')),
+    ('index', re.compile(
+        r'IndexFormatTooOldException'
+        r'|IndexFormatTooNewException'
+        r'|CorruptIndexException'
+        r'|CorruptStateException'
+        r'|TranslogCorruptedException'
+        r'|was created with version \[.*\] but the minimum compatible version')),
+]
+
+
+class LogWatcher:
+    """Watches the log output of a node for fatal errors while it starts.
+
+    The watcher is a consumer of the node's output monitor. While armed, the
+    first line that matches one of the `FATAL_PATTERNS` kills the node
+    process, which aborts `CrateNode.start` right away instead of waiting for
+    its timeout. The lines that preceded the match are kept as context.
+    """
+
+    def __init__(self, node, patterns=FATAL_PATTERNS, context=20):
+        self.node = node
+        self.patterns = patterns
+        self.armed = False
+        self.matches: List[Tuple[str, str]] = []
+        self.lines: List[str] = []
+        self._context = context
+        self._recent: deque = deque(maxlen=context)
+
+    def arm(self):
+        self.matches.clear()
+        self.lines.clear()
+        self._recent.clear()
+        self.armed = True
+
+    def disarm(self):
+        self.armed = False
+
+    def send(self, line: str):
+        line = line.rstrip()
+        if not self.armed:
+            return
+        if self.matches:
+            # keep collecting the stack trace that follows the match
+            if len(self.lines) < 2 * self._context:
+                self.lines.append(line)
+            return
+        self._recent.append(line)
+        for kind, pattern in self.patterns:
+            if pattern.search(line):
+                self.matches.append((kind, line))
+                self.lines.extend(self._recent)
+                self._kill()
+                return
+
+    def _kill(self):
+        proc = self.node.process
+        if proc and proc.poll() is None:
+            proc.kill()
+
+
+class LogCapture:
+    """Keeps the last lines of a node's log in memory.
+
+    The full log is written to a gzip compressed file at `path`, so the
+    memory used per node stays constant regardless of the log volume.
+    """
+
+    def __init__(self, path, max_lines=1000):
+        self.path = path
+        self.lines: deque = deque(maxlen=max_lines)
+        self.total = 0
+        self._lock = Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+
+    def send(self, line: str):
+        line = line.rstrip()
+        with self._lock:
+            self.lines.append(line)
+            self.total += 1
+            if self._file:
+                self._file.write(line + '\n')
+
+    def close(self, keep=True):
+        """Close the log file and remove it unless `keep` is true."""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+        if not keep and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+TIME_UNITS = OrderedDict([
+    ('nanos', 1e-9),
+    ('micros', 1e-6),
+    ('ms', 1e-3),
+    ('s', 1),
+    ('m', 60),
+    ('h', 3600),
+    ('d', 86400),
+])
+TIME_VALUE_RE = re.compile(r'^\s*(?P<value>[\d.]+)\s*(?P<unit>nanos|micros|ms|s|m|h|d)\s*$')
+
+
+def parse_time_value(value: str) -> float:
+    """Parse a time value as printed by CrateDB into seconds.
+
+    >>> parse_time_value('1.5s')
+    1.5
+    >>> parse_time_value('250ms')
+    0.25
+    """
+    m = TIME_VALUE_RE.match(value)
+    if not m:
+        raise ValueError(f'Invalid time value: {value}')
+    return float(m.group('value')) * TIME_UNITS[m.group('unit')]
+
+
+class GcPause(NamedTuple):
+    collector: str
+    duration: float
+
+
+class Recovery(NamedTuple):
+    index: str
+    shard: int
+    source: str
+    duration: float
+
+
+class SlowQuery(NamedTuple):
+    logger: str
+    duration: float
+
+
+GC_MONITOR_RE = re.compile(
+    r'\[gc\]\[(?P<collector>\w+)\]\[\d+\]\[\d+\] duration \[(?P<duration>[^\]]+)\]')
+GC_UNIFIED_RE = re.compile(
+    r'GC\(\d+\) Pause (?P<collector>\w+).* (?P<duration>[\d.]+ms)\s*$')
+RECOVERY_RE = re.compile(
+    r'\[(?P<index>[^\[\]]+)\]\[(?P<shard>\d+)\]\]? recovery completed from '
+    r'(?P<source>.+?), took ?\[(?P<duration>[^\]]+)\]')
+SLOW_LOG_RE = re.compile(
+    r'\[(?P<logger>[\w.]*(slowlog|i\.s\.s|i\.i\.s)[\w.]*)\s*\].*took\[(?P<duration>[^\]]+)\]')
+
+
+def parse_line(line: str):
+    """Parse a log line into a GcPause, Recovery or SlowQuery record.
+
+    Returns `None` if the line doesn't contain any of these events.
+    """
+    m = GC_MONITOR_RE.search(line) or GC_UNIFIED_RE.search(line)
+    if m:
+        return GcPause(m.group('collector'), parse_time_value(m.group('duration')))
+    m = RECOVERY_RE.search(line)
+    if m:
+        return Recovery(m.group('index'),
+                        int(m.group('shard')),
+                        m.group('source'),
+                        parse_time_value(m.group('duration')))
+    m = SLOW_LOG_RE.search(line)
+    if m:
+        return SlowQuery(m.group('logger'), parse_time_value(m.group('duration')))
+    return None
+
+
+class LogStats:
+    """Aggregates the events parsed from the logs of all nodes of a test."""
+
+    def __init__(self):
+        self.gc_pauses: List[GcPause] = []
+        self.recoveries: List[Recovery] = []
+        self.slow_queries: List[SlowQuery] = []
+
+    def add(self, record):
+        if isinstance(record, GcPause):
+            self.gc_pauses.append(record)
+        elif isinstance(record, Recovery):
+            self.recoveries.append(record)
+        elif isinstance(record, SlowQuery):
+            self.slow_queries.append(record)
+
+    @property
+    def total_gc_pause(self) -> float:
+        return sum(p.duration for p in self.gc_pauses)
+
+    @property
+    def longest_gc_pause(self) -> Optional[GcPause]:
+        return max(self.gc_pauses, key=lambda p: p.duration, default=None)
+
+    @property
+    def recoveries_by_index(self) -> Dict[str, List[float]]:
+        by_index: Dict[str, List[float]] = OrderedDict()
+        for r in self.recoveries:
+            by_index.setdefault(r.index, []).append(r.duration)
+        return by_index
+
+    @property
+    def slow_query_count(self) -> int:
+        return len(self.slow_queries)
+
+    def __bool__(self):
+        return bool(self.gc_pauses or self.recoveries or self.slow_queries)
+
+    def summary(self) -> List[str]:
+        lines = []
+        if self.gc_pauses:
+            longest = self.longest_gc_pause
+            lines.append(f'GC pauses: {len(self.gc_pauses)}, '
+                         f'total: {self.total_gc_pause:.3f}s, '
+                         f'longest: {longest.duration:.3f}s ({longest.collector})')
+        for index, durations in self.recoveries_by_index.items():
+            lines.append(f'Recoveries of {index}: {len(durations)}, '
+                         f'total: {sum(durations):.3f}s, longest: {max(durations):.3f}s')
+        if self.slow_queries:
+            lines.append(f'Slow queries: {self.slow_query_count}, '
+                         f'longest: {max(q.duration for q in self.slow_queries):.3f}s')
+        return lines
+
+
+class LogAnalyzer:
+    """Output monitor consumer that feeds parsed log events into LogStats."""
+
+    def __init__(self, stats: LogStats):
+        self.stats = stats
+
+    def send(self, line: str):
+        record = parse_line(line)
+        if record:
+            self.stats.add(record)
+
+
+NODE_STARTED_RE = re.compile(r'\[o\.e\.n\.Node\s*\] \[.*\] started$')
+
+
+class StartupTimer:
+    """Records when a node published its HTTP and PostgreSQL addresses.
+
+    The timestamps are taken from `time.monotonic` when the corresponding
+    log line is read from the node's output, `started` is the time of the
+    line that announces that the node has started.
+    """
+
+    def __init__(self):
+        self.published: Dict[str, float] = {}
+        self.started: Optional[float] = None
+        self._addr_consumer = AddrConsumer(self._on_addr)
+
+    def _on_addr(self, protocol, addr):
+        self.published.setdefault(protocol, time.monotonic())
+
+    def send(self, line: str):
+        self._addr_consumer.send(line)
+        if self.started is None and NODE_STARTED_RE.search(line.rstrip()):
+            self.started = time.monotonic()
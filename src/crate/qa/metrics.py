@@ -0,0 +1,128 @@
+import os
+import json
+import math
+import time
+import statistics
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+
+BENCH_OUTPUT = os.environ.get('CRATE_QA_BENCH_OUTPUT')
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Return the `p`-th percentile of the values (nearest rank).
+
+    >>> percentile([1, 2, 3, 4, 5, 6, 7, 8, 9, 10], 90)
+    9
+    >>> percentile([3, 1, 2], 50)
+    2
+    """
+    if not values:
+        raise ValueError('percentile requires at least one value')
+    ordered = sorted(values)
+    rank = min(max(math.ceil(p / 100 * len(ordered)), 1), len(ordered))
+    return ordered[rank - 1]
+
+
+class Summary(NamedTuple):
+    n: int
+    mean: float
+    median: float
+    stdev: float
+    min: float
+    max: float
+    p90: float
+    p99: float
+
+    def __str__(self):
+        return (f'n={self.n} mean={self.mean:.3f} median={self.median:.3f} '
+                f'stdev={self.stdev:.3f} min={self.min:.3f} max={self.max:.3f} '
+                f'p90={self.p90:.3f} p99={self.p99:.3f}')
+
+
+def summarize(values: Iterable[float]) -> Summary:
+    """Return summary statistics of the values.
+
+    >>> summarize([1, 2, 3])
+    Summary(n=3, mean=2, median=2, stdev=1.0, min=1, max=3, p90=3, p99=3)
+    """
+    values = list(values)
+    return Summary(
+        n=len(values),
+        mean=statistics.mean(values),
+        median=statistics.median(values),
+        stdev=statistics.stdev(values) if len(values) > 1 else 0.0,
+        min=min(values),
+        max=max(values),
+        p90=percentile(values, 90),
+        p99=percentile(values, 99),
+    )
+
+
+def record_results(benchmark: str, results: Iterable[Dict[str, Any]]):
+    """Append benchmark results as JSON lines to ``CRATE_QA_BENCH_OUTPUT``.
+
+    Each result is stored together with the benchmark name and a timestamp,
+    so that results of multiple runs can be compared over time.
+    Does nothing if ``CRATE_QA_BENCH_OUTPUT`` isn't set.
+    """
+    if not BENCH_OUTPUT:
+        return
+    now = time.time()
+    with open(BENCH_OUTPUT, 'a', encoding='utf-8') as f:
+        for result in results:
+            record = {'benchmark': benchmark, 'timestamp': now}
+            record.update(result)
+            f.write(json.dumps(record) + '\n')
+
+
+class LatencyMatrix:
+    """Latencies of statements measured against multiple versions.
+
+    Measurements of the same statement and version are combined, even if
+    they were taken on different clusters.
+    """
+
+    def __init__(self):
+        self.versions: List[str] = []
+        self.statements: List[str] = []
+        self._latencies: Dict[Tuple[str, str], List[float]] = OrderedDict()
+        self._lock = Lock()
+
+    def add(self, version: str, statement: str, duration: float):
+        with self._lock:
+            if version not in self.versions:
+                self.versions.append(version)
+            if statement not in self.statements:
+                self.statements.append(statement)
+            self._latencies.setdefault((version, statement), []).append(duration)
+
+    def __bool__(self):
+        return bool(self._latencies)
+
+    def summary(self, version: str, statement: str) -> Summary:
+        return summarize(self._latencies[(version, statement)])
+
+    def format(self, width=40) -> List[str]:
+        """Return the median latency in ms as table of statement x version."""
+        col = max([len(v) for v in self.versions] + [10])
+        lines = [' ' * width + ' '.join(f'{v:>{col}}' for v in self.versions)]
+        for statement in self.statements:
+            label = ' '.join(statement.split())
+            if len(label) > width - 1:
+                label = label[:width - 4] + '...'
+            cells = []
+            for version in self.versions:
+                latencies = self._latencies.get((version, statement))
+                cells.append(f'{statistics.median(latencies) * 1000:>{col}.2f}'
+                             if latencies else f'{"-":>{col}}')
+            lines.append(f'{label:<{width}}' + ' '.join(cells))
+        return lines
+
+    def results(self) -> Iterable[Dict[str, Any]]:
+        """Return one result per statement and version for `record_results`."""
+        for (version, statement), latencies in self._latencies.items():
+            summary = summarize(latencies)
+            yield dict(version=version, statement=' '.join(statement.split()), **summary._asdict())
@@ -0,0 +1,112 @@
+import os
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Dict
+from crate.client import connect
+
+ROUND_ROBIN = 'round_robin'
+LEAST_LOADED = 'least_loaded'
+CLIENT_STRATEGY = os.environ.get('CRATE_QA_CLIENT_STRATEGY', ROUND_ROBIN)
+
+
+class ClusterClient:
+    """Pooled connections to the HTTP and PostgreSQL endpoints of all nodes.
+
+    Connections are opened on first use and kept (with keep-alive) until
+    `close` is called. The node that serves a request is chosen by
+    `strategy`:
+
+    ``round_robin``
+        `connection` returns one connection to all nodes, the client
+        rotates the nodes with every request.
+    ``least_loaded``
+        `connection` leases the connection to the node with the fewest
+        leases in use.
+
+    PostgreSQL connections are leased from a pool per node (requires
+    psycopg2) and balanced the same way.
+    """
+
+    def __init__(self, nodes, strategy=CLIENT_STRATEGY, max_psql_connections=8):
+        if strategy not in (ROUND_ROBIN, LEAST_LOADED):
+            raise ValueError(f'Unknown client strategy: {strategy}')
+        self.nodes = list(nodes)
+        self.strategy = strategy
+        self.max_psql_connections = max_psql_connections
+        self._lock = Lock()
+        self._shared: Any = None
+        self._connections: Dict[int, Any] = {}
+        self._psql_pools: Dict[int, Any] = {}
+        self._leases = [0] * len(self.nodes)
+        self._next = 0
+
+    def _pick(self) -> int:
+        with self._lock:
+            if self.strategy == LEAST_LOADED:
+                idx = min(range(len(self.nodes)), key=lambda i: self._leases[i])
+            else:
+                idx = self._next % len(self.nodes)
+                self._next += 1
+            self._leases[idx] += 1
+            return idx
+
+    def _release(self, idx: int):
+        with self._lock:
+            self._leases[idx] -= 1
+
+    @contextmanager
+    def connection(self):
+        """Lease a `crate.client` connection, which stays open afterwards."""
+        if self.strategy == ROUND_ROBIN:
+            with self._lock:
+                if self._shared is None:
+                    self._shared = connect([n.http_url for n in self.nodes], error_trace=True)
+            yield self._shared
+            return
+        idx = self._pick()
+        try:
+            with self._lock:
+                conn = self._connections.get(idx)
+                if conn is None:
+                    conn = connect(self.nodes[idx].http_url, error_trace=True)
+                    self._connections[idx] = conn
+            yield conn
+        finally:
+            self._release(idx)
+
+    @contextmanager
+    def psql_connection(self, user='crate', dbname='doc'):
+        """Lease a psycopg2 connection from the pool of one of the nodes."""
+        from psycopg2.pool import ThreadedConnectionPool
+        idx = self._pick()
+        try:
+            with self._lock:
+                pool = self._psql_pools.get(idx)
+                if pool is None:
+                    addr = self.nodes[idx].addresses.psql
+                    pool = ThreadedConnectionPool(
+                        1, self.max_psql_connections,
+                        host=addr.host, port=addr.port, user=user, dbname=dbname)
+                    self._psql_pools[idx] = pool
+            conn = pool.getconn()
+            try:
+                yield conn
+            finally:
+                pool.putconn(conn)
+        finally:
+            self._release(idx)
+
+    def close(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            if self._shared is not None:
+                connections.append(self._shared)
+            pools = list(self._psql_pools.values())
+            self._shared = None
+            self._connections.clear()
+            self._psql_pools.clear()
+        for conn in connections:
+            conn.close()
+        for pool in pools:
+            pool.closeall()
+
@@ -0,0 +1,174 @@
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class ShardRecovery(NamedTuple):
+    """Recovery state of a shard copy as reported by ``sys.shards``."""
+    schema: str
+    table: str
+    partition_ident: str
+    id: int
+    primary: bool
+    node: Optional[str]
+    state: str
+    stage: Optional[str]
+    type: Optional[str]
+    size_used: Optional[int]
+    size_recovered: Optional[int]
+    files_used: Optional[int]
+    files_recovered: Optional[int]
+    total_time: Optional[int]
+
+    @property
+    def key(self) -> Tuple[str, str, str, int, bool]:
+        return (self.schema, self.table, self.partition_ident, self.id, self.primary)
+
+    @property
+    def label(self) -> str:
+        """State of the shard copy: ``UNASSIGNED``, a recovery stage or ``DONE``."""
+        if self.state == 'UNASSIGNED':
+            return 'UNASSIGNED'
+        if self.state == 'INITIALIZING' and self.stage and self.stage != 'DONE':
+            return self.stage
+        if self.state == 'INITIALIZING':
+            return 'INIT'
+        return 'DONE'
+
+
+RECOVERY_QUERY = """
+    SELECT schema_name, table_name, partition_ident, id, "primary", _node['name'],
+           state, recovery['stage'], recovery['type'],
+           recovery['size']['used'], recovery['size']['recovered'],
+           recovery['files']['used'], recovery['files']['recovered'],
+           recovery['total_time']
+    FROM sys.shards
+"""
+
+
+class ShardRecoveryStats(NamedTuple):
+    shard: str
+    type: Optional[str]
+    bytes: int
+    files: int
+    seconds: float
+    stages: Dict[str, float]
+
+    @property
+    def throughput(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+
+class RecoveryTracker:
+    """Follows the recovery of shards while `wait_for` polls ``sys.shards``.
+
+    Pass it to `wait_for` (or a function that calls it) with the
+    `observers` argument. Every poll records the state of each shard copy;
+    the time a shard copy spends in each state (``UNASSIGNED``, the
+    recovery stages ``INIT``, ``INDEX``, ``VERIFY_INDEX``, ``TRANSLOG`` and
+    ``FINALIZE``) is attributed to the time between polls, so its accuracy
+    is bounded by the poll interval.
+
+    Shard copies are identified by table, partition, shard id and whether
+    they are primaries, so replicas of tables with more than one replica
+    are combined.
+    """
+
+    source = 'recovery'
+
+    def __init__(self):
+        self.started = time.monotonic()
+        # (seconds since start, shard copies per state, bytes recovered)
+        self.timeline: List[Tuple[float, Dict[str, int], int]] = []
+        self._transitions: Dict[tuple, List[Tuple[float, str]]] = OrderedDict()
+        self._last: Dict[tuple, ShardRecovery] = OrderedDict()
+
+    def observe(self, rows: List[ShardRecovery]):
+        now = time.monotonic() - self.started
+        counts: Dict[str, int] = OrderedDict()
+        recovered = 0
+        for row in rows:
+            label = row.label
+            counts[label] = counts.get(label, 0) + 1
+            recovered += row.size_recovered or 0
+            transitions = self._transitions.setdefault(row.key, [])
+            if not transitions or transitions[-1][1] != label:
+                transitions.append((now, label))
+            self._last[row.key] = row
+        if not self.timeline or self.timeline[-1][1:] != (counts, recovered):
+            self.timeline.append((now, counts, recovered))
+
+    def _stages(self, transitions: List[Tuple[float, str]]) -> Dict[str, float]:
+        stages: Dict[str, float] = OrderedDict()
+        bounds = [t for t, _ in transitions[1:]] + [transitions[-1][0]]
+        for (start, label), end in zip(transitions, bounds):
+            if label != 'DONE':
+                stages[label] = stages.get(label, 0.0) + end - start
+        return stages
+
+    def stage_span(self, stage: str) -> Optional[float]:
+        """Return the seconds from the first shard copy entering `stage` until
+        the last one left it.
+
+        Returns `None` if no shard copy was seen in `stage` for longer than a
+        single poll, e.g. because the stage was shorter than the poll
+        interval.
+        """
+        starts, ends = [], []
+        for transitions in self._transitions.values():
+            bounds = [t for t, _ in transitions[1:]] + [transitions[-1][0]]
+            for (start, label), end in zip(transitions, bounds):
+                if label == stage:
+                    starts.append(start)
+                    ends.append(end)
+        span = max(ends) - min(starts) if starts else 0.0
+        return span if span > 0 else None
+
+    def shard_stats(self) -> List[ShardRecoveryStats]:
+        """Return the recovery statistics of every shard copy that was recovering."""
+        stats = []
+        for key, transitions in self._transitions.items():
+            stages = self._stages(transitions)
+            if not stages:
+                # the shard copy was already started when tracking began
+                continue
+            row = self._last[key]
+            schema, table, partition, shard_id, primary = key
+            name = '.'.join(x for x in (schema, table, partition) if x)
+            total_time = (row.total_time or 0) / 1000
+            stats.append(ShardRecoveryStats(
+                shard=f'{name}[{shard_id}]{"p" if primary else "r"}',
+                type=row.type,
+                bytes=row.size_recovered or 0,
+                files=row.files_recovered or 0,
+                seconds=total_time or sum(stages.values()),
+                stages=stages,
+            ))
+        return stats
+
+    def summary(self, max_shards=10) -> List[str]:
+        """Return aggregate statistics, the `max_shards` slowest shard copies
+        and the timeline."""
+        stats = self.shard_stats()
+        if not stats:
+            return []
+        mb = 1024 * 1024
+        duration = self.timeline[-1][0] if self.timeline else 0.0
+        total_bytes = sum(s.bytes for s in stats)
+        stages: Dict[str, float] = OrderedDict()
+        for s in stats:
+            for stage, seconds in s.stages.items():
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        lines = [
+            f'Recovered {len(stats)} shard copies, {total_bytes / mb:.1f}MB in {duration:.3f}s '
+            f'({total_bytes / mb / duration if duration else 0:.1f}MB/s)',
+            'Shard seconds per state: ' + ', '.join(f'{k}: {v:.3f}s' for k, v in stages.items()),
+        ]
+        for s in sorted(stats, key=lambda s: s.seconds, reverse=True)[:max_shards]:
+            lines.append(f'  {s.shard:40} {s.type or "-":14} {s.seconds:8.3f}s '
+                         f'{s.bytes / mb:8.1f}MB {s.throughput / mb:7.1f}MB/s {s.files:5d} files')
+        lines.append('Timeline:')
+        for t, counts, recovered in self.timeline:
+            states = ', '.join(f'{k}: {v}' for k, v in counts.items())
+            lines.append(f'  {t:8.3f}s {recovered / mb:8.1f}MB recovered  {states}')
+        return lines
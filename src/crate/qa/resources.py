@@ -0,0 +1,167 @@
+import os
+import time
+from array import array
+from collections import OrderedDict
+from threading import Thread, Event
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def proc_available() -> bool:
+    return os.path.isdir('/proc/self')
+
+
+class ProcSample(NamedTuple):
+    cpu_seconds: float
+    rss_bytes: int
+    read_bytes: int
+    write_bytes: int
+    open_files: int
+
+
+def read_proc(pid: int) -> ProcSample:
+    """Read the resource usage of a process from ``/proc/<pid>``."""
+    with open(f'/proc/{pid}/stat') as f:
+        # the command in field 2 may contain spaces, so split after it
+        fields = f.read().rsplit(')', 1)[1].split()
+    utime, stime = int(fields[11]), int(fields[12])
+    rss_pages = int(fields[21])
+    io = {}
+    try:
+        with open(f'/proc/{pid}/io') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                io[key] = int(value)
+    except PermissionError:
+        pass
+    open_files = len(os.listdir(f'/proc/{pid}/fd'))
+    return ProcSample(
+        cpu_seconds=(utime + stime) / CLK_TCK,
+        rss_bytes=rss_pages * PAGE_SIZE,
+        read_bytes=io.get('read_bytes', 0),
+        write_bytes=io.get('write_bytes', 0),
+        open_files=open_files,
+    )
+
+
+class PhaseStats(NamedTuple):
+    phase: str
+    samples: int
+    cpu_mean: float
+    cpu_peak: float
+    rss_mean: float
+    rss_peak: float
+    read_bytes: float
+    write_bytes: float
+    open_files_peak: float
+
+    def __str__(self):
+        mb = 1024 * 1024
+        return (f'{self.phase:8} samples: {self.samples:5d}  '
+                f'cpu: {self.cpu_mean:6.1f}% (peak {self.cpu_peak:6.1f}%)  '
+                f'rss: {self.rss_mean / mb:7.1f}MB (peak {self.rss_peak / mb:7.1f}MB)  '
+                f'io: {self.read_bytes / mb:7.1f}MB read, {self.write_bytes / mb:7.1f}MB written  '
+                f'open files: {int(self.open_files_peak)}')
+
+
+class NodeSampler:
+    """Samples the resource usage of a node process in a background thread.
+
+    The process of the node is looked up on every sample, so restarts of the
+    node are followed. The samples are stored in arrays, one per metric;
+    CPU usage is stored in percent of one core and disk I/O as bytes since
+    the previous sample. Samples are assigned to the phase that was set last
+    with `phase`.
+    """
+
+    def __init__(self, node, interval=1.0, phase='start'):
+        self.node = node
+        self.interval = interval
+        self.time = array('d')
+        self.cpu = array('d')
+        self.rss = array('d')
+        self.read_bytes = array('d')
+        self.write_bytes = array('d')
+        self.open_files = array('d')
+        self.phases: List[Tuple[str, int]] = [(phase, 0)]
+        self._previous: Optional[Tuple[int, float, ProcSample]] = None
+        self._stopped = Event()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def phase(self, name: str):
+        if self.phases[-1][0] != name:
+            self.phases.append((name, len(self.time)))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._sample()
+            except (FileNotFoundError, ProcessLookupError):
+                # the process exited between the lookup and the read
+                self._previous = None
+            self._stopped.wait(self.interval)
+
+    def _sample(self):
+        proc = self.node.process
+        if not proc or proc.poll() is not None:
+            self._previous = None
+            return
+        now = time.monotonic()
+        sample = read_proc(proc.pid)
+        previous = self._previous
+        self._previous = (proc.pid, now, sample)
+        if not previous or previous[0] != proc.pid:
+            return
+        _, then, last = previous
+        self.time.append(now)
+        self.cpu.append(100 * (sample.cpu_seconds - last.cpu_seconds) / (now - then))
+        self.rss.append(sample.rss_bytes)
+        self.read_bytes.append(sample.read_bytes - last.read_bytes)
+        self.write_bytes.append(sample.write_bytes - last.write_bytes)
+        self.open_files.append(sample.open_files)
+
+    def _slices(self) -> List[Tuple[str, int, int]]:
+        bounds = [idx for _, idx in self.phases[1:]] + [len(self.time)]
+        return [(name, start, end)
+                for (name, start), end in zip(self.phases, bounds)
+                if end > start]
+
+    def stats(self) -> List[PhaseStats]:
+        """Return peak and mean values per phase and for all samples.
+
+        Phases that were entered multiple times are combined.
+        """
+        by_phase: Dict[str, List[int]] = OrderedDict()
+        for name, start, end in self._slices():
+            by_phase.setdefault(name, []).extend(range(start, end))
+        by_phase['total'] = list(range(len(self.time)))
+        return [self._phase_stats(name, idx)
+                for name, idx in by_phase.items() if idx]
+
+    def _phase_stats(self, name: str, idx: List[int]) -> PhaseStats:
+        n = len(idx)
+        cpu = [self.cpu[i] for i in idx]
+        rss = [self.rss[i] for i in idx]
+        return PhaseStats(
+            phase=name,
+            samples=n,
+            cpu_mean=sum(cpu) / n,
+            cpu_peak=max(cpu),
+            rss_mean=sum(rss) / n,
+            rss_peak=max(rss),
+            read_bytes=sum(self.read_bytes[i] for i in idx),
+            write_bytes=sum(self.write_bytes[i] for i in idx),
+            open_files_peak=max(self.open_files[i] for i in idx),
+        )
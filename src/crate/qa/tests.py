@@ -3,22 +3,44 @@ import sys
 import math
 import time
 import shutil
+import queue
+import atexit
 import string
 import tempfile
 import functools
+import subprocess
 from unittest.case import _Outcome
 from pprint import pformat
-from threading import Thread
-from collections import OrderedDict
-from typing import Dict, Any, NamedTuple
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict, defaultdict
+from typing import Dict, Any, NamedTuple, Optional, Callable, List, Tuple
 from distutils.version import StrictVersion as V
 from faker.generator import random
-from cr8.run_crate import CrateNode, LineBuffer, get_crate, _extract_version
-from cr8.insert_fake_data import SELLECT_COLS, create_row_generator
+from cr8.run_crate import CrateNode, get_crate, _extract_version
+from cr8.insert_fake_data import SELLECT_COLS
 from cr8.insert_json import to_insert
+from crate.client import connect
+from crate.client.exceptions import ProgrammingError
+from crate.qa.logs import LogWatcher, LogCapture, LogStats, LogAnalyzer
+from crate.qa.resources import NodeSampler, proc_available
+from crate.qa.cache import CdsArchive, SnapshotCache
+from crate.qa.datagen import RowGenerator
+from crate.qa.fixtures import FixtureStore
+from crate.qa.pool import ClusterClient, CLIENT_STRATEGY
+from crate.qa.recovery import ShardRecovery, RECOVERY_QUERY
 
 DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
+USE_CDS = os.environ.get('CRATE_QA_CDS', 'false').lower() == 'true'
+USE_SNAPSHOT_CACHE = os.environ.get('CRATE_QA_SNAPSHOT_CACHE', 'false').lower() == 'true'
 CRATEDB_0_57 = V('0.57.0')
+LOG_DIR = os.environ.get(
+    'CRATE_QA_LOG_DIR', os.path.join(tempfile.gettempdir(), 'crate-qa-logs'))
+LOG_TAIL_LINES = int(os.environ.get('CRATE_LOG_TAIL_LINES', '1000'))
+HEALTH_LEVELS = ('RED', 'YELLOW', 'GREEN')
+DATA_SCALE_SPEC = os.environ.get('CRATE_QA_DATA_SCALE', 'small')
+INSERT_CONCURRENCY = int(os.environ.get('CRATE_QA_INSERT_CONCURRENCY', '1'))
+DATA_SEED = int(os.environ.get('CRATE_QA_DATA_SEED', '0'))
 
 
 print_error = functools.partial(print, file=sys.stderr)
@@ -40,11 +62,32 @@ def test_settings(version: V) -> Dict[str, Any]:
     return s
 
 
+def new_log_capture(name: str) -> LogCapture:
+    return LogCapture(os.path.join(LOG_DIR, f'{name}-{gen_id()}.log.gz'),
+                      max_lines=LOG_TAIL_LINES)
+
+
 def version_tuple_to_strict_version(version_tuple: tuple) -> V:
     return V('.'.join([str(v) for v in version_tuple]))
 
 
-def columns_for_table(conn, schema, table):
+@functools.lru_cache(maxsize=None)
+def resolve_version(version: str) -> str:
+    """Return the CrateDB directory that a version or alias resolves to.
+
+    The result is cached, so every node of a test run uses the same build of
+    an alias like ``latest-nightly``, even if a newer one is released while
+    the tests run.
+    """
+    return get_crate(version)
+
+
+def resolved_name(version: str) -> str:
+    """Return the name of the CrateDB build that `version` resolves to."""
+    return os.path.basename(resolve_version(version).rstrip(os.sep))
+
+
+def _columns_for_table(conn, schema, table):
     c = conn.cursor()
     c.execute("SELECT min(version['number']) FROM sys.nodes")
     version = V(c.fetchone()[0])
@@ -54,16 +97,497 @@ def columns_for_table(conn, schema, table):
     return OrderedDict(c.fetchall())
 
 
-def insert_data(conn, schema, table, num_rows):
+class TableSchema(NamedTuple):
+    columns: Dict[str, str]
+    insert_stmt: str
+
+
+class SchemaCache:
+    """Columns and INSERT statement of tables per cluster.
+
+    Entries are keyed by the servers of the connection, the lowest CrateDB
+    version among them (as seen when the connection was opened) and the
+    table, so a node that was restarted with another version doesn't get
+    the entries of its predecessor. They are invalidated for the servers of
+    a node when it is stopped (`WatchedCrateNode.stop`, `stop_node` and
+    `kill_node`), and by `NodeProvider.tearDown`. DDL statements aren't
+    tracked: Tests that change the columns of a table after inserting data
+    into it must call `invalidate` themselves.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[Tuple[str, ...], str, str, str], TableSchema] = {}
+        self._lock = Lock()
+
+    def get(self, conn, schema, table) -> TableSchema:
+        servers = tuple(sorted(s.rstrip('/') for s in conn.client.server_pool))
+        version = str(getattr(conn, 'lowest_server_version', ''))
+        key = (servers, version, schema, table)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            columns = _columns_for_table(conn, schema, table)
+            stmt, _ = to_insert(f'"{schema}"."{table}"', columns)
+            entry = TableSchema(columns, stmt)
+            if columns:
+                # an unknown table may be created later on
+                with self._lock:
+                    self._entries[key] = entry
+        return entry
+
+    def invalidate(self, server=None, schema=None, table=None):
+        """Remove the entries of a server, schema and/or table.
+
+        `server` is the HTTP URL of a node. Without arguments all entries
+        are removed.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                servers, _, s, t = key
+                if ((server is None or server.rstrip('/') in servers)
+                        and (schema is None or schema == s)
+                        and (table is None or table == t)):
+                    del self._entries[key]
+
+
+schema_cache = SchemaCache()
+
+
+def columns_for_table(conn, schema, table):
+    return schema_cache.get(conn, schema, table).columns
+
+
+class InsertStats(NamedTuple):
+    rows: int
+    failed: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f'{self.rows} rows ({self.failed} failed) in {self.seconds:.3f}s, '
+                f'{self.rows_per_second:.0f} rows/s')
+
+
+class InsertError(Exception):
+    """Raised if not all rows could be inserted into a table."""
+
+    def __init__(self, table: str, stats: InsertStats):
+        super().__init__(f'Inserting into {table} failed for {stats.failed} of {stats.rows} rows')
+        self.stats = stats
+
+
+def insert_data(conn, schema, table, num_rows, bulk_size=10000,
+                concurrency=INSERT_CONCURRENCY, hosts=None, seed=DATA_SEED,
+                raise_on_failure=True) -> InsertStats:
+    """Insert `num_rows` rows of generated data into a table.
+
+    The data is generated by a `RowGenerator` seeded with `seed`, so the
+    same table is always filled with the same data for a given seed.
+    The rows are generated lazily and sent in bulk requests of at most
+    `bulk_size` rows. With a `concurrency` greater than 1 the bulk requests
+    are sent by multiple threads, each with its own connection to one of
+    `hosts` (round robin) or sharing `conn` if no hosts are given. At most
+    two bulks per thread are generated ahead of sending, so memory usage
+    doesn't depend on `num_rows`.
+
+    Raises an `InsertError` if some of the rows failed, unless
+    `raise_on_failure` is false.
+    """
+    cols, stmt = schema_cache.get(conn, schema, table)
+    rows = RowGenerator(cols, seed)
+    started = time.monotonic()
+    failed = []
+    errors = []
+    bulks: queue.Queue = queue.Queue(maxsize=2 * concurrency)
+
+    def send(worker_conn):
+        c = worker_conn.cursor()
+        while True:
+            bulk = bulks.get()
+            if bulk is None:
+                return
+            if errors:
+                continue
+            try:
+                results = c.executemany(stmt, bulk)
+                failed.append(sum(1 for r in results if r.get('rowcount', 0) < 0))
+            except Exception as e:
+                errors.append(e)
+
+    conns = [connect(hosts[x % len(hosts)], error_trace=True) if hosts else conn
+             for x in range(concurrency)]
+    threads = [Thread(target=send, args=(c,)) for c in conns]
+    for t in threads:
+        t.start()
+    try:
+        for offset in range(0, num_rows, bulk_size):
+            if errors:
+                break
+            bulks.put(rows.generate(min(bulk_size, num_rows - offset)))
+    finally:
+        for _ in threads:
+            bulks.put(None)
+        for t in threads:
+            t.join()
+        if hosts:
+            for c in conns:
+                c.close()
+    if errors:
+        raise errors[0]
+    conn.cursor().execute(f'REFRESH TABLE "{schema}"."{table}"')
+    stats = InsertStats(num_rows, sum(failed), time.monotonic() - started)
+    if DEBUG:
+        print(f'# Inserted into {schema}.{table}: {stats}')
+    if raise_on_failure and stats.failed:
+        raise InsertError(f'{schema}.{table}', stats)
+    return stats
+
+
+def load_fixture(conn, schema, table, num_rows, seed=DATA_SEED, files=4,
+                 raise_on_failure=True) -> InsertStats:
+    """Load `num_rows` rows of generated data into a table with ``COPY FROM``.
+
+    The data is generated by a `RowGenerator` seeded with `seed` and
+    written into the `FixtureStore` on first use, later runs reuse the
+    files. They are imported by the nodes themselves, which requires that
+    the nodes run on this machine. The files are shared, so each of them is
+    imported by one node only.
+
+    Raises an `InsertError` if some of the rows weren't imported, unless
+    `raise_on_failure` is false.
+    """
     cols = columns_for_table(conn, schema, table)
-    stmt, args = to_insert(f'"{schema}"."{table}"', cols)
-    gen_row = create_row_generator(cols)
+    path = FixtureStore().path(cols, num_rows, seed, files)
+    started = time.monotonic()
     c = conn.cursor()
-    c.executemany(stmt, [gen_row() for x in range(num_rows)])
+    c.execute(f"""
+        COPY "{schema}"."{table}" FROM 'file://{path}/*.json.gz'
+        WITH (compression = 'gzip', shared = true)
+    """)
+    imported = c.rowcount
     c.execute(f'REFRESH TABLE "{schema}"."{table}"')
+    stats = InsertStats(num_rows, num_rows - imported, time.monotonic() - started)
+    if DEBUG:
+        print(f'# Loaded into {schema}.{table}: {stats}')
+    if raise_on_failure and stats.failed:
+        raise InsertError(f'{schema}.{table}', stats)
+    return stats
+
+
+class DataScale(NamedTuple):
+    """Volume of the data that tests create.
+
+    `rows` and `shards` apply to the main table of a test, `tables` is the
+    number of additional tables with `rows` rows each (see
+    `create_scaled_tables`), which are partitioned into `partitions`
+    partitions if it is greater than 0.
+    """
+    rows: int
+    shards: int
+    tables: int
+    partitions: int
+
+    @property
+    def timeout(self) -> float:
+        """Seconds to wait for the data to be recovered."""
+        return 60 + self.rows * (self.tables + 1) / 10000
+
+    @property
+    def scaled_shards(self) -> int:
+        """Number of shards of the tables created by `create_scaled_tables`."""
+        partitions = min(self.partitions, self.rows) if self.partitions else 1
+        return self.tables * partitions * self.shards
+
+
+DATA_SCALES = {
+    'small': DataScale(rows=10, shards=3, tables=0, partitions=0),
+    'medium': DataScale(rows=100000, shards=6, tables=2, partitions=4),
+    'large': DataScale(rows=1000000, shards=12, tables=4, partitions=8),
+}
+
+
+def data_scale(spec: str) -> DataScale:
+    """Parse a data scale from a preset name, optionally followed by overrides.
+
+    >>> data_scale('small')
+    DataScale(rows=10, shards=3, tables=0, partitions=0)
+    >>> data_scale('medium,rows=5000,partitions=0')
+    DataScale(rows=5000, shards=6, tables=2, partitions=0)
+
+    Raises a `ValueError` if the spec is invalid.
+    """
+    preset, *overrides = [x.strip() for x in spec.split(',')]
+    if preset not in DATA_SCALES:
+        raise ValueError(f'Invalid data scale "{spec}": unknown preset "{preset}", '
+                         f'valid presets: {", ".join(DATA_SCALES)}')
+    scale = DATA_SCALES[preset]
+    for override in overrides:
+        key, _, value = (x.strip() for x in override.partition('='))
+        if key not in DataScale._fields:
+            raise ValueError(f'Invalid data scale "{spec}": unknown key "{key}", '
+                             f'valid keys: {", ".join(DataScale._fields)}')
+        try:
+            scale = scale._replace(**{key: int(value)})
+        except ValueError:
+            raise ValueError(f'Invalid data scale "{spec}": '
+                             f'{key} must be an integer, not "{value}"') from None
+    return scale
+
+
+SCALED_TABLE = '''
+CREATE TABLE "doc"."{name}" (
+    id INTEGER,
+    {partition_column}
+    col_int INTEGER,
+    col_long LONG,
+    col_double DOUBLE,
+    col_string STRING,
+    col_timestamp TIMESTAMP
+) CLUSTERED INTO {shards} SHARDS {partitioned_by}
+WITH (number_of_replicas = 0)
+'''
+
+
+def scaled_tables(scale: DataScale) -> List[str]:
+    return [f'scaled_{x}' for x in range(scale.tables)]
+
+
+def create_scaled_tables(conn, scale: DataScale):
+    """Create the additional tables of a data scale and fill them from
+    fixture files (see `load_fixture`)."""
+    c = conn.cursor()
+    for name in scaled_tables(scale):
+        partitioned = scale.partitions > 0
+        c.execute(SCALED_TABLE.format(
+            name=name,
+            shards=scale.shards,
+            partition_column=(f'part INTEGER GENERATED ALWAYS AS id % {scale.partitions},'
+                              if partitioned else ''),
+            partitioned_by='PARTITIONED BY (part)' if partitioned else '',
+        ))
+        load_fixture(conn, 'doc', name, scale.rows)
+
+
+class ShardGroup(NamedTuple):
+    """Number of shards of a table that share the same state."""
+    schema: str
+    table: str
+    primary: bool
+    state: str
+    routing_state: str
+    recovery_stage: Optional[str]
+    count: int
+
+
+class NodeInfo(NamedTuple):
+    id: str
+    name: str
+    version: str
+
+
+class ClusterInfo(NamedTuple):
+    name: str
+    master_node: Optional[str]
+
+
+# Each source is fetched with a single query per poll, no matter how many
+# conditions depend on it.
+WAIT_SOURCES = {
+    'shards': ("""
+        SELECT schema_name, table_name, "primary", state, routing_state,
+               recovery['stage'], count(*)
+        FROM sys.shards
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """, ShardGroup),
+    'nodes': ("""
+        SELECT id, name, version['number'] FROM sys.nodes
+    """, NodeInfo),
+    'cluster': ("""
+        SELECT name, master_node FROM sys.cluster
+    """, ClusterInfo),
+    'recovery': (RECOVERY_QUERY, ShardRecovery),
+}
+
+
+class Condition(NamedTuple):
+    """A predicate over the rows of one of the `WAIT_SOURCES`."""
+    description: str
+    source: str
+    predicate: Callable[[List[Any]], bool]
+
+
+class WaitResult(NamedTuple):
+    description: str
+    duration: float
+    polls: int
+
+
+# All waits of the current test, see `NodeProvider._report_waits`
+wait_log: List[WaitResult] = []
+
+
+def _matches(group: ShardGroup, schema, table) -> bool:
+    return ((schema is None or group.schema == schema)
+            and (table is None or group.table == table))
+
+
+def shards_started(num=0, table=None, schema=None) -> Condition:
+    """Condition that is met once shards have been started.
+
+    If `num` is `0` there must be no shards that aren't started, otherwise
+    there must be exactly `num` started shards.
+    If `table` and/or `schema` is given, only shards of matching tables
+    are considered.
+    """
+    def predicate(groups):
+        groups = [g for g in groups if _matches(g, schema, table)]
+        if num > 0:
+            return sum(g.count for g in groups if g.state == 'STARTED') == num
+        if table is not None and not groups:
+            return False
+        return all(g.state == 'STARTED' for g in groups)
+    name = '.'.join(x for x in (schema, table) if x) or 'all tables'
+    return Condition(f'{num or "all"} shards started ({name})', 'shards', predicate)
+
+
+def no_relocating_shards() -> Condition:
+    return Condition(
+        'no relocating shards',
+        'shards',
+        lambda groups: all(g.routing_state != 'RELOCATING' for g in groups)
+    )
+
+
+def recoveries_done() -> Condition:
+    return Condition(
+        'all recoveries done',
+        'shards',
+        lambda groups: all(g.state == 'STARTED' and g.recovery_stage in (None, 'DONE')
+                           for g in groups)
+    )
+
+
+def health_of(groups: List[ShardGroup]) -> str:
+    """Return the health of the cluster based on the shard states.
+
+    The health is ``GREEN`` if all shards are started, ``YELLOW`` if all
+    primary shards are started and ``RED`` otherwise.
+
+    ``sys.shards`` is empty until the gateway has recovered the metadata
+    of the tables, so the health of a cluster whose tables aren't known yet
+    is ``GREEN`` as well. Use `health_reached` with `min_shards` if the
+    cluster is expected to have shards.
+    """
+    not_started = [g for g in groups if g.state != 'STARTED']
+    if any(g.primary for g in not_started):
+        return 'RED'
+    if not_started:
+        return 'YELLOW'
+    return 'GREEN'
+
+
+def health_reached(health='GREEN', min_shards=0) -> Condition:
+    """Condition that is met once the cluster has reached `health`.
+
+    If `min_shards` is greater than 0, at least that many shards must exist,
+    regardless of their state (see `health_of`).
+    """
+    min_level = HEALTH_LEVELS.index(health)
+
+    def predicate(groups):
+        return (sum(g.count for g in groups) >= min_shards
+                and HEALTH_LEVELS.index(health_of(groups)) >= min_level)
+    description = f'health {health}' + (f' ({min_shards} shards)' if min_shards else '')
+    return Condition(description, 'shards', predicate)
+
+
+def nodes_joined(num) -> Condition:
+    return Condition(
+        f'{num} nodes joined',
+        'nodes',
+        lambda nodes: len(nodes) == num
+    )
+
+
+def master_elected() -> Condition:
+    return Condition(
+        'master elected',
+        'cluster',
+        lambda rows: any(c.master_node for c in rows)
+    )
+
+
+def _fetch(cursor, source):
+    stmt, row_type = WAIT_SOURCES[source]
+    cursor.execute(stmt)
+    return [row_type(*row) for row in cursor.fetchall()]
+
+
+def wait_for(cursor, *conditions: Condition, timeout=60, min_interval=0.05, max_interval=1.0,
+             observers=()) -> WaitResult:
+    """Wait until all conditions are met.
+
+    The sources the conditions depend on are polled adaptively: As long as
+    their rows change between polls the interval stays at `min_interval`,
+    otherwise it is doubled up to `max_interval`. This bounds the time that
+    is overslept after the conditions are met by `max_interval`.
+
+    `observers` are objects with a `source` attribute naming one of the
+    `WAIT_SOURCES` and an `observe` method, which is called with the rows of
+    the source on every poll (see `RecoveryTracker`).
+
+    Sources that fail with a `ProgrammingError` are retried, because sys
+    tables aren't available until the cluster has formed. If the conditions
+    aren't met within `timeout`, the error of the last poll (if any) is the
+    cause of the `TimeoutError`.
+
+    The result is also recorded in `wait_log`.
+    """
+    description = ', '.join(c.description for c in conditions)
+    sources = list(OrderedDict.fromkeys(
+        [c.source for c in conditions] + [o.source for o in observers]))
+    started = time.monotonic()
+    deadline = started + timeout
+    interval = min_interval
+    snapshot: Optional[Dict[str, Any]] = None
+    polls = 0
+    while True:
+        polls += 1
+        previous, snapshot = snapshot, {}
+        error = None
+        for source in sources:
+            try:
+                snapshot[source] = _fetch(cursor, source)
+            except ProgrammingError as e:
+                snapshot[source] = None
+                error = e
+        for o in observers:
+            if snapshot[o.source] is not None:
+                o.observe(snapshot[o.source])
+        if all(snapshot[c.source] is not None and c.predicate(snapshot[c.source])
+               for c in conditions):
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if DEBUG:
+                print('-' * 70)
+                print(f'waited: {timeout} polls: {polls} for: {description}')
+                print(f'=== {pformat(snapshot)}')
+                if error:
+                    print(f'=== last error: {error}')
+                print('-' * 70)
+            raise TimeoutError(f"Conditions not met within {timeout}s: {description}") from error
+        interval = min_interval if snapshot != previous else min(interval * 2, max_interval)
+        time.sleep(min(interval, remaining))
+    result = WaitResult(description, time.monotonic() - started, polls)
+    wait_log.append(result)
+    return result
 
 
-def wait_for_active_shards(cursor, num_active=0, timeout=60, f=1.2):
+def wait_for_active_shards(cursor, num_active=0, timeout=60, observers=()):
     """Wait for shards to become active
 
     If `num_active` is `0` this will wait until there are no shards that aren't
@@ -71,31 +595,370 @@ def wait_for_active_shards(cursor, num_active=0, timeout=60, f=1.2):
     If `num_active > 0` this will wait until there are `num_active` shards with
     the state `STARTED`
     """
-    waited = 0
-    duration = 0.1
-    while waited < timeout:
-        if num_active > 0:
-            cursor.execute(
-                "SELECT count(*) FROM sys.shards where state = 'STARTED'")
-            if int(cursor.fetchone()[0]) == num_active:
-                return
-        else:
-            cursor.execute(
-                "SELECT count(*) FROM sys.shards WHERE state != 'STARTED'")
-            if int(cursor.fetchone()[0]) == 0:
-                return
-        time.sleep(duration)
-        waited += duration
-        duration *= f
+    return wait_for(cursor, shards_started(num_active), timeout=timeout, observers=observers)
+
+
+class SegmentStats(NamedTuple):
+    """Lucene segments of the primary shards of a table."""
+    segments: int
+    size: int
+    docs: int
+
+
+def segment_stats(cursor, schema, table) -> Optional[SegmentStats]:
+    """Return the segment statistics of a table from ``sys.segments``.
+
+    Returns `None` for versions that don't have ``sys.segments``.
+    """
+    try:
+        cursor.execute("""
+            SELECT count(*), sum(size), sum(num_docs)
+            FROM sys.segments
+            WHERE table_schema = ? AND table_name = ? AND "primary" = true
+        """, (schema, table))
+    except ProgrammingError:
+        return None
+    segments, size, docs = cursor.fetchone()
+    return SegmentStats(segments, size or 0, docs or 0)
+
+
+class NodeStartupError(Exception):
+    """Raised if a fatal error was logged while a node was starting."""
+
+    def __init__(self, name, matches, lines):
+        self.matches = matches
+        self.lines = lines
+        kinds = ', '.join(kind for kind, _ in matches)
+        log = '\n'.join(lines)
+        super().__init__(f'Node {name} failed to start ({kinds}):\n{log}')
+
+
+class WatchedCrateNode(CrateNode):
+    """CrateNode that aborts its start as soon as a fatal error is logged.
+
+    Once the HTTP port is up, `CrateNode.start` polls the node without
+    checking whether its process is still running, so a node that is killed
+    in that phase still fails only after cr8's timeout of 30s.
+
+    It also notifies its `phase_listeners` about the lifecycle phase it is
+    in: ``start``, ``restart``, ``workload`` and ``stop``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.watcher = LogWatcher(self)
+        self.monitor.consumers.append(self.watcher)
+        self.phase_listeners: List[Callable[[str], None]] = []
+        self.cds_archive: Optional[CdsArchive] = None
+        self._started = False
+
+    def set_phase(self, phase: str):
+        for listener in self.phase_listeners:
+            listener(phase)
+
+    def start(self):
+        self.set_phase('restart' if self._started else 'start')
+        self._started = True
+        self.watcher.arm()
+        try:
+            super().start()
+        except SystemExit:
+            # raised by CrateNode.start if the process died
+            if self.watcher.matches:
+                raise NodeStartupError(
+                    node_name(self), self.watcher.matches, self.watcher.lines) from None
+            raise
+        finally:
+            self.watcher.disarm()
+        self.set_phase('workload')
+
+    def stop(self):
+        self.set_phase('stop')
+        if self.http_url:
+            schema_cache.invalidate(server=self.http_url)
+        super().stop()
+        if self.cds_archive:
+            returncode = self.process and self.process.returncode
+            self.cds_archive.commit(complete=returncode is not None and returncode >= 0)
+
+
+def create_node(version, settings, env):
+    """Create a (not yet started) CrateNode for the given version.
+
+    The test settings matching the resolved version are applied on top of
+    the given settings.
+    """
+    crate_dir = resolve_version(version)
+    version_tuple = _extract_version(crate_dir)
+    v = version_tuple_to_strict_version(version_tuple)
+    s = dict(settings)
+    s.update(test_settings(v))
+    e = dict(env)
+    e['CRATE_HOME'] = crate_dir
+    archive = None
+    if USE_CDS:
+        archive = CdsArchive(crate_dir, e.get('JAVA_HOME', os.environ.get('JAVA_HOME')))
+        java_opts = archive.java_opts()
+        if java_opts:
+            e['CRATE_JAVA_OPTS'] = ' '.join(x for x in (e.get('CRATE_JAVA_OPTS'), java_opts) if x)
 
     if DEBUG:
-        print('-' * 70)
-        print(f'waited: {waited} last duration: {duration} timeout: {timeout}')
-        cursor.execute('SELECT count(*), table_name, state FROM sys.shards GROUP BY 2, 3 ORDER BY 2')
-        rs = cursor.fetchall()
-        print(f'=== {rs}')
-        print('-' * 70)
-    raise TimeoutError(f"Shards didn't become active within {timeout}s.")
+        print(f'# Running CrateDB {version} ({v}) ...')
+        s_nice = pformat(s)
+        print(f'with settings: {s_nice}')
+        e_nice = pformat(e)
+        print(f'with environment: {e_nice}')
+
+    n = WatchedCrateNode(
+        crate_dir=crate_dir,
+        keep_data=True,
+        settings=s,
+        env=e,
+    )
+    n._settings = s  # CrateNode does not hold its settings
+    n.cds_archive = archive
+    return (n, version_tuple)
+
+
+def node_name(node: CrateNode) -> str:
+    settings = getattr(node, '_settings', {})
+    if 'node.name' in settings:
+        return settings['node.name']
+    if node.process:
+        return f'pid {node.process.pid}'
+    return node.crate_dir
+
+
+def stop_node(node: CrateNode, timeout=30) -> float:
+    """Stop a node and return the duration of the shutdown in seconds.
+
+    The node is terminated gracefully and killed if it didn't stop within
+    `timeout` seconds.
+    """
+    started = time.monotonic()
+    if isinstance(node, WatchedCrateNode):
+        node.set_phase('stop')
+    if node.http_url:
+        schema_cache.invalidate(server=node.http_url)
+    proc = node.process
+    if proc and proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            print_error(f'# Killing node {node_name(node)} after {timeout}s')
+            proc.kill()
+            proc.wait()
+    node.stop()
+    return time.monotonic() - started
+
+
+def kill_node(node: CrateNode):
+    """Kill a node without a graceful shutdown, as if it crashed."""
+    if isinstance(node, WatchedCrateNode):
+        node.set_phase('stop')
+    if node.http_url:
+        schema_cache.invalidate(server=node.http_url)
+    proc = node.process
+    if proc and proc.poll() is None:
+        proc.kill()
+        proc.wait()
+    node.stop()
+
+
+def stop_nodes(nodes, timeout=30) -> Dict[str, float]:
+    """Stop the given nodes concurrently.
+
+    Returns the shutdown duration in seconds for each node by node name.
+    """
+    durations: Dict[str, float] = OrderedDict()
+    errors = []
+
+    def stop(node):
+        try:
+            durations[node_name(node)] = stop_node(node, timeout)
+        except Exception as e:
+            errors.append(e)
+
+    threads = []
+    for node in nodes:
+        t = Thread(target=stop, args=(node,))
+        t.start()
+        threads.append(t)
+    [t.join() for t in threads]
+    if DEBUG and durations:
+        for name, duration in durations.items():
+            print(f'# Stopped node {name} in {duration:.2f}s')
+    if errors:
+        raise errors[0]
+    return durations
+
+
+class StandbyNode:
+    """A node that is created and started in a background thread."""
+
+    def __init__(self, version, settings, env, tmp_root=None):
+        self.tmpdir = tempfile.mkdtemp(dir=tmp_root)
+        self.node = None
+        self.buffer = new_log_capture('standby')
+        self._error: Optional[BaseException] = None
+        s = {
+            'path.data': self.tmpdir,
+            'cluster.name': gen_id(),
+        }
+        s.update(settings)
+        self._thread = Thread(target=self._start, args=(version, s, env))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _start(self, version, settings, env):
+        try:
+            (self.node, _) = create_node(version, settings, env)
+            self.node.monitor.consumers.append(self.buffer)
+            self.node.start()
+        except BaseException as e:
+            self._error = e
+
+    def result(self):
+        """Wait until the node is started and return it."""
+        self._thread.join()
+        if self._error:
+            self.discard()
+            raise self._error
+        return self.node
+
+    def discard(self):
+        self._thread.join()
+        if self.node:
+            stop_node(self.node)
+        self.buffer.close(keep=False)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+class NodePool:
+    """Pool of standby nodes keyed by version, settings and environment.
+
+    Claiming a node from the pool immediately starts a replacement in the
+    background, so the startup of the node for the next test overlaps with
+    the current test instead of adding to it.
+
+    Standby nodes use their own data directory and, unless specified in the
+    settings, a unique cluster name. The pool is meant for single node tests,
+    because a standby node occupies ports while the current test runs.
+    """
+
+    def __init__(self, size=1):
+        self.size = size
+        self._lock = Lock()
+        self._standby = defaultdict(list)
+
+    @staticmethod
+    def _key(version, settings, env, tmp_root):
+        return (
+            version,
+            tuple(sorted((k, str(v)) for k, v in settings.items())),
+            tuple(sorted(env.items())),
+            tmp_root,
+        )
+
+    def _fill(self, key, version, settings, env, tmp_root):
+        standby = self._standby[key]
+        while len(standby) < self.size:
+            standby.append(StandbyNode(version, settings, env, tmp_root))
+
+    def claim(self, version, settings, env, tmp_root=None) -> StandbyNode:
+        """Claim a started node and start a replacement in the background.
+
+        The data directory of the node is created in `tmp_root`, or in the
+        default temporary directory if it is `None`.
+        """
+        key = self._key(version, settings, env, tmp_root)
+        with self._lock:
+            self._fill(key, version, settings, env, tmp_root)
+            standby = self._standby[key].pop(0)
+            self._fill(key, version, settings, env, tmp_root)
+        standby.result()
+        return standby
+
+    def close(self):
+        with self._lock:
+            for standby in (n for nodes in self._standby.values() for n in nodes):
+                standby.discard()
+            self._standby.clear()
+
+
+_node_pool: Optional[NodePool] = None
+
+
+def node_pool(size) -> NodePool:
+    global _node_pool
+    if _node_pool is None:
+        _node_pool = NodePool(size)
+        atexit.register(_node_pool.close)
+    return _node_pool
+
+
+def release_node_pool():
+    """Stop the standby nodes of the pool, see `node_pool`."""
+    global _node_pool
+    if _node_pool is not None:
+        _node_pool.close()
+        _node_pool = None
+
+
+class TmpdirReaper:
+    """Removes directories in a background thread.
+
+    Directories are renamed first, so that their path can be reused right
+    away, and then deleted asynchronously. At most `max_pending` directories
+    are queued, `remove` blocks if the deletion falls behind further.
+    """
+
+    def __init__(self, max_pending=8):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+
+    def remove(self, path: str):
+        trash = path.rstrip(os.sep) + '.trash-' + gen_id()
+        try:
+            os.rename(path, trash)
+        except FileNotFoundError:
+            return
+        except OSError:
+            trash = path
+        self._ensure_started()
+        self._queue.put(trash)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+                atexit.register(self.join)
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Wait until all queued directories are removed."""
+        self._queue.join()
+
+
+tmpdir_reaper = TmpdirReaper()
+
+
+class ClusterReadiness(NamedTuple):
+    """Seconds until each phase of the cluster formation was reached."""
+    master_elected: float
+    nodes_joined: float
+    health: float
 
 
 class VersionDef(NamedTuple):
@@ -105,20 +968,89 @@ class VersionDef(NamedTuple):
 
 class CrateCluster:
 
-    def __init__(self, nodes=[]):
+    def __init__(self, nodes=[], client_strategy=CLIENT_STRATEGY):
         self._nodes = nodes
+        self._client_strategy = client_strategy
+        self._client: Optional[ClusterClient] = None
+
+    @property
+    def client(self) -> ClusterClient:
+        """Pooled connections to all nodes, see `ClusterClient`.
+
+        The connections are closed when the cluster is stopped or one of its
+        nodes is replaced.
+        """
+        if self._client is None:
+            self._client = ClusterClient(self._nodes, self._client_strategy)
+        return self._client
+
+    def close_client(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
 
     def start(self):
-        threads = []
-        for node in self._nodes:
-            t = Thread(target=node.start)
-            t.start()
-            threads.append(t)
-        [t.join() for t in threads]
+        """Start all nodes concurrently.
 
-    def stop(self):
-        for node in self._nodes:
-            node.stop()
+        If a node fails to start (e.g. with a `NodeStartupError`), the other
+        nodes are killed, all nodes are stopped and the first error is
+        raised.
+        """
+        error = None
+        with ThreadPoolExecutor(max_workers=max(len(self._nodes), 1)) as executor:
+            futures = [executor.submit(node.start) for node in self._nodes]
+            for future in as_completed(futures):
+                if future.exception() and error is None:
+                    error = future.exception()
+                    # abort the start of the other nodes
+                    for node in self._nodes:
+                        proc = node.process
+                        if proc and proc.poll() is None:
+                            proc.kill()
+        if error:
+            try:
+                stop_nodes(self._nodes)
+            finally:
+                # the start error takes precedence over errors while stopping
+                raise error
+
+    def stop(self, timeout=30) -> Dict[str, float]:
+        """Stop all nodes concurrently.
+
+        Returns the shutdown duration of each node, see `stop_nodes`.
+        """
+        self.close_client()
+        return stop_nodes(self._nodes, timeout)
+
+    def wait_until_ready(self, health='GREEN', timeout=60, observers=(),
+                         min_shards=0) -> ClusterReadiness:
+        """Wait until the cluster has formed.
+
+        The phases are awaited in order: A master is elected, all nodes have
+        joined the cluster and the cluster health has reached `health`
+        with at least `min_shards` shards (see `health_reached`).
+        Returns the seconds until each phase was reached, measured from the
+        call of this method. `observers` are passed on to `wait_for`.
+        """
+        phases = (
+            ('master_elected', master_elected()),
+            ('nodes_joined', nodes_joined(len(self._nodes))),
+            ('health', health_reached(health, min_shards)),
+        )
+        started = time.monotonic()
+        deadline = started + timeout
+        timings = {}
+        with self.client.connection() as conn:
+            c = conn.cursor()
+            for phase, condition in phases:
+                wait_for(c, condition,
+                         timeout=max(deadline - time.monotonic(), 0),
+                         observers=observers)
+                timings[phase] = time.monotonic() - started
+        readiness = ClusterReadiness(**timings)
+        if DEBUG:
+            print(f'# Cluster ready: {readiness}')
+        return readiness
 
     def node(self):
         return random.choice(self._nodes)
@@ -127,6 +1059,7 @@ class CrateCluster:
         return next(self._nodes)
 
     def __setitem__(self, idx, node):
+        self.close_client()
         self._nodes[idx] = node
 
     def __getitem__(self, idx):
@@ -137,7 +1070,15 @@ class NodeProvider:
 
     CRATE_VERSION = os.environ.get('CRATE_VERSION', 'latest-nightly')
     CRATE_HEAP_SIZE = os.environ.get('CRATE_HEAP_SIZE', '512m')
+    NODE_POOL_SIZE = int(os.environ.get('CRATE_NODE_POOL_SIZE', '0'))
+    SHUTDOWN_TIMEOUT = int(os.environ.get('CRATE_SHUTDOWN_TIMEOUT', '30'))
+    SAMPLE_INTERVAL = float(os.environ.get('CRATE_QA_SAMPLE_INTERVAL', '0'))
+    # Put path.data on a RAM backed file system. Only suited for tests that
+    # don't depend on the behaviour of a real disk.
+    DATA_ON_TMPFS = os.environ.get('CRATE_QA_DATA_ON_TMPFS', 'false').lower() == 'true'
+    TMPFS_DIR = os.environ.get('CRATE_QA_TMPFS_DIR', '/dev/shm')
     DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
+    DATA_SCALE = data_scale(DATA_SCALE_SPEC)
 
     # _outcome is an attribute of unittest.TestCase
     # we need to declare it so that static analysis with mypy does not fail
@@ -147,24 +1088,36 @@ class NodeProvider:
         self.tmpdirs = []
         super().__init__(*args, **kwargs)
 
-    def mkdtemp(self, *args):
-        tmp = tempfile.mkdtemp()
+    def mkdtemp(self, *args, tmpfs=False):
+        tmp = tempfile.mkdtemp(dir=self._tmpfs_root() if tmpfs else None)
         self.tmpdirs.append(tmp)
         return os.path.join(tmp, *args)
 
+    def _tmpfs_root(self):
+        if os.path.isdir(self.TMPFS_DIR):
+            return self.TMPFS_DIR
+        print_error(f'# {self.TMPFS_DIR} does not exist, using the default temporary directory')
+        return None
+
     def _unicast_hosts(self, num, transport_port=4300):
         return ','.join([
             '127.0.0.1:' + str(transport_port + x)
             for x in range(num)
         ])
 
-    def _new_cluster(self, version, num_nodes, settings={}):
+    def _new_cluster(self, version, num_nodes, settings={}, transport_port=None):
+        """Create a cluster of `num_nodes` nodes.
+
+        If `transport_port` is given, the nodes bind to consecutive transport
+        ports starting at it, which isolates clusters that run concurrently.
+        """
         self.assertTrue(hasattr(self, '_new_node'))
         for port in ['transport.tcp.port', 'http.port', 'psql.port']:
             self.assertFalse(port in settings)
         s = {
             'cluster.name': gen_id(),
-            'discovery.zen.ping.unicast.hosts': self._unicast_hosts(num_nodes),
+            'discovery.zen.ping.unicast.hosts': self._unicast_hosts(
+                num_nodes, transport_port or 4300),
             'discovery.zen.minimum_master_nodes': math.floor(num_nodes / 2.0 + 1),
             'gateway.recover_after_nodes': num_nodes,
             'gateway.expected_nodes': num_nodes,
@@ -174,85 +1127,201 @@ class NodeProvider:
         nodes = []
         for id in range(num_nodes):
             s['node.name'] = s['cluster.name'] + '-' + str(id)
+            if transport_port:
+                s['transport.tcp.port'] = transport_port + id
             nodes.append(self._new_node(version, s)[0])
-        return CrateCluster(nodes)
+        cluster = CrateCluster(nodes)
+        self._clusters.append(cluster)
+        return cluster
 
-    def upgrade_node(self, old_node, new_version):
-        old_node.stop()
+    def _stop_cluster(self, cluster: CrateCluster) -> Dict[str, float]:
+        """Stop the nodes of a single cluster, leaving other nodes running."""
+        try:
+            return cluster.stop(self.SHUTDOWN_TIMEOUT)
+        finally:
+            for node in cluster:
+                self._on_stop.remove(node)
+            if cluster in self._clusters:
+                self._clusters.remove(cluster)
+
+    def upgrade_node(self, old_node, new_version, on_phase=None):
+        """Replace a node with a node of `new_version` using the same settings.
+
+        `on_phase` is called with the phase the upgrade enters: ``stopping``
+        while the old node shuts down, ``node down`` until the new node is
+        started and ``rejoining`` once it has been started.
+        """
+        on_phase = on_phase or (lambda phase: None)
+        on_phase('stopping')
+        stop_node(old_node, self.SHUTDOWN_TIMEOUT)
         self._on_stop.remove(old_node)
+        on_phase('node down')
         (new_node, _) = self._new_node(new_version, old_node._settings)
         new_node.start()
+        on_phase('rejoining')
         return new_node
 
+    def _restore_or_seed(self, version, fixture, seed, data_path=None):
+        """Restore a seeded data directory from the snapshot cache.
+
+        The snapshot is keyed by the resolved CrateDB build of `version` and
+        `fixture`, a JSON serializable description of the seeded data.
+        On a cache miss `seed` is called to populate `data_path` (default:
+        ``self._path_data``) with all nodes stopped. It returns JSON
+        serializable metadata that is stored with the snapshot and returned
+        by this method.
+        """
+        data_path = data_path or self._path_data
+        if not USE_SNAPSHOT_CACHE:
+            return seed()
+        cache = SnapshotCache()
+        key = cache.key(resolved_name(version), fixture)
+        meta = cache.restore(key, data_path)
+        if meta is not None:
+            if DEBUG:
+                print(f'# Restored data of {version} from snapshot {key}')
+            return meta
+        meta = seed()
+        cache.store(key, data_path, meta)
+        return meta
+
     def setUp(self):
-        self._path_data = self.mkdtemp()
+        self._path_data = self.mkdtemp(tmpfs=self.DATA_ON_TMPFS)
         self._on_stop = []
+        self._clusters = []
         self._log_consumers = []
+        self._log_analyzers = []
+        self._log_stats = LogStats()
+        self._samplers = []
 
         def new_node(version, settings={}):
-            crate_dir = get_crate(version)
-            version_tuple = _extract_version(crate_dir)
-            v = version_tuple_to_strict_version(version_tuple)
             s = {
                 'path.data': self._path_data,
                 'cluster.name': 'crate-qa',
             }
             s.update(settings)
-            s.update(test_settings(v))
-            e = {
-                'CRATE_HEAP_SIZE': self.CRATE_HEAP_SIZE,
-                'CRATE_HOME': crate_dir,
-            }
-
-            if self.DEBUG:
-                print(f'# Running CrateDB {version} ({v}) ...')
-                s_nice = pformat(s)
-                print(f'with settings: {s_nice}')
-                e_nice = pformat(e)
-                print(f'with environment: {e_nice}')
-
-            n = CrateNode(
-                crate_dir=crate_dir,
-                keep_data=True,
-                settings=s,
-                env=e,
-            )
-            n._settings = s  # CrateNode does not hold its settings
+            (n, version_tuple) = create_node(version, s, self._node_env())
             self._add_log_consumer(n)
+            self._add_sampler(n)
             self._on_stop.append(n)
             return (n, version_tuple)
         self._new_node = new_node
 
+    @classmethod
+    def tearDownClass(cls):
+        # standby nodes occupy ports and data directories, they must not
+        # outlive the test class they were started for
+        release_node_pool()
+        super().tearDownClass()
+
+    def _node_env(self):
+        return {
+            'CRATE_HEAP_SIZE': self.CRATE_HEAP_SIZE,
+        }
+
+    def _claim_node(self, version, settings={}):
+        """Return a started single node.
+
+        If ``NODE_POOL_SIZE`` is greater than ``0`` the node is claimed from
+        the standby pool, which boots the node for the next test in the
+        background. Otherwise a new node is created and started. The standby
+        nodes are stopped when the test class is torn down.
+        """
+        if self.NODE_POOL_SIZE <= 0:
+            (node, _) = self._new_node(version, settings)
+            node.start()
+            return node
+        pool = node_pool(self.NODE_POOL_SIZE)
+        tmp_root = self._tmpfs_root() if self.DATA_ON_TMPFS else None
+        standby = pool.claim(version, settings, self._node_env(), tmp_root)
+        self.tmpdirs.append(standby.tmpdir)
+        self._add_log_consumer(standby.node, standby.buffer)
+        self._add_sampler(standby.node, phase='workload')
+        self._on_stop.append(standby.node)
+        return standby.node
+
     def tearDown(self):
         self._crate_logs_on_failure()
+        self._report_log_stats()
+        self._report_waits()
         self._process_on_stop()
+        self._report_resources()
+        schema_cache.invalidate()
         for tmp in self.tmpdirs:
             if DEBUG:
                 print(f'# Removing temporary directory {tmp}')
-            shutil.rmtree(tmp, ignore_errors=True)
+            tmpdir_reaper.remove(tmp)
         self.tmpdirs.clear()
 
-    def _process_on_stop(self):
-        for n in self._on_stop:
-            n.stop()
-        self._on_stop.clear()
+    def _process_on_stop(self) -> Dict[str, float]:
+        for cluster in self._clusters:
+            cluster.close_client()
+        self._clusters.clear()
+        try:
+            return stop_nodes(self._on_stop, self.SHUTDOWN_TIMEOUT)
+        finally:
+            self._on_stop.clear()
 
-    def _add_log_consumer(self, node: CrateNode):
-        buffer = LineBuffer()
-        node.monitor.consumers.append(buffer)
+    def _add_log_consumer(self, node: CrateNode, buffer=None):
+        if buffer is None:
+            buffer = new_log_capture(self.id())
+            node.monitor.consumers.append(buffer)
         self._log_consumers.append((node, buffer))
+        analyzer = LogAnalyzer(self._log_stats)
+        node.monitor.consumers.append(analyzer)
+        self._log_analyzers.append((node, analyzer))
 
     def _crate_logs_on_failure(self):
+        has_error = self._has_error()
         for node, buffer in self._log_consumers:
             node.monitor.consumers.remove(buffer)
-            if self._has_error():
+            buffer.close(keep=has_error)
+            if has_error:
                 print_error('=' * 70)
                 print_error('CrateDB logs for test ' + self.id())
+                print_error(f'Last {len(buffer.lines)} of {buffer.total} lines, '
+                            f'full log: {buffer.path}')
                 print_error('-' * 70)
                 for line in buffer.lines:
                     print_error(line)
                 print_error('-' * 70)
         self._log_consumers.clear()
 
+    def _add_sampler(self, node: CrateNode, phase='start'):
+        if self.SAMPLE_INTERVAL <= 0 or not proc_available():
+            return
+        sampler = NodeSampler(node, self.SAMPLE_INTERVAL, phase)
+        node.phase_listeners.append(sampler.phase)
+        self._samplers.append(sampler.start())
+
+    def _report_resources(self):
+        for sampler in self._samplers:
+            sampler.stop()
+            sampler.node.phase_listeners.remove(sampler.phase)
+            stats = sampler.stats()
+            if stats:
+                print_error(f'# Resource usage of node {node_name(sampler.node)} in {self.id()}')
+                for phase_stats in stats:
+                    print_error(f'#   {phase_stats}')
+        self._samplers.clear()
+
+    def _report_log_stats(self):
+        for node, analyzer in self._log_analyzers:
+            node.monitor.consumers.remove(analyzer)
+        self._log_analyzers.clear()
+        if self._log_stats:
+            print_error(f'# CrateDB log events of test {self.id()}')
+            for line in self._log_stats.summary():
+                print_error(f'#   {line}')
+        self._log_stats = LogStats()
+
+    def _report_waits(self):
+        if DEBUG and wait_log:
+            total = sum(w.duration for w in wait_log)
+            print(f'# Waits of {self.id()} (total: {total:.2f}s)')
+            for w in wait_log:
+                print(f'#   {w.duration:6.2f}s {w.polls:4d} polls  {w.description}')
+        wait_log.clear()
+
     def _has_error(self) -> bool:
         return any(error for (_, error) in self._outcome.errors)
@@ -0,0 +1,151 @@
+import time
+import random
+from collections import OrderedDict
+from threading import Thread, Event
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from crate.client import connect
+from crate.client.exceptions import ConnectionError
+from crate.qa.metrics import percentile
+
+
+# Seconds a thread waits after a failed request
+ERROR_BACKOFF = 0.1
+
+
+class Request(NamedTuple):
+    phase: str
+    kind: str
+    latency: float
+    error: Optional[str]
+
+
+class PhaseLatency(NamedTuple):
+    phase: str
+    kind: str
+    requests: int
+    errors: int
+    p50: float
+    p90: float
+    p99: float
+    max: float
+
+    def __str__(self):
+        return (f'{self.phase:12} {self.kind:5} requests: {self.requests:6d}  '
+                f'errors: {self.errors:5d}  '
+                f'p50: {self.p50 * 1000:8.2f}ms  p90: {self.p90 * 1000:8.2f}ms  '
+                f'p99: {self.p99 * 1000:8.2f}ms  max: {self.max * 1000:8.2f}ms')
+
+
+class BackgroundWorkload:
+    """Issues a mix of reads and writes against a cluster from background threads.
+
+    Every thread has its own connection to the hosts returned by `hosts`,
+    which is called again to reconnect after an error, so nodes that were
+    replaced in the meantime are picked up; hosts that are `None` (stopped
+    nodes) are skipped. Each request is
+    assigned to the phase that was set last with `phase`, its latency and
+    error (if any) are recorded.
+
+    `write` is a tuple of a statement and a function that returns its
+    parameters; a request is a write with the probability `write_ratio`.
+    """
+
+    def __init__(self,
+                 hosts: Callable[[], List[str]],
+                 read: str,
+                 write: Tuple[str, Callable[[], Sequence[Any]]],
+                 threads=2,
+                 write_ratio=0.2,
+                 interval=0.0,
+                 phase='start'):
+        self.hosts = hosts
+        self.read = read
+        self.write = write
+        self.write_ratio = write_ratio
+        self.interval = interval
+        self.requests: List[Request] = []
+        self._phase = phase
+        self._stopped = Event()
+        self._threads = [Thread(target=self._run) for _ in range(threads)]
+        for t in self._threads:
+            t.daemon = True
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        for t in self._threads:
+            t.join()
+
+    def phase(self, name: str):
+        self._phase = name
+
+    def _run(self):
+        conn = None
+        while not self._stopped.is_set():
+            kind = 'write' if random.random() < self.write_ratio else 'read'
+            phase = self._phase
+            started = time.monotonic()
+            error = None
+            try:
+                if conn is None:
+                    # nodes that are down have no URL, connecting fails if
+                    # none of the remaining hosts is available
+                    hosts = [h for h in self.hosts() if h]
+                    if not hosts:
+                        raise ConnectionError('No hosts available')
+                    conn = connect(hosts, error_trace=True)
+                c = conn.cursor()
+                if kind == 'write':
+                    stmt, args = self.write
+                    c.execute(stmt, args())
+                else:
+                    c.execute(self.read)
+                    c.fetchall()
+            except Exception as e:
+                # record any error instead of ending the thread, keep only the
+                # first line, the rest is the server side stack trace
+                lines = str(e).splitlines()
+                error = f'{type(e).__name__}: {lines[0] if lines else ""}'
+                if conn is not None:
+                    conn.close()
+                conn = None
+            self.requests.append(Request(phase, kind, time.monotonic() - started, error))
+            # back off after errors, refused connections fail immediately
+            self._stopped.wait(max(self.interval, ERROR_BACKOFF) if error else self.interval)
+        if conn is not None:
+            conn.close()
+
+    def stats(self) -> List[PhaseLatency]:
+        """Return latency percentiles and errors per phase and request kind.
+
+        The phases are ordered by the time they were first entered.
+        """
+        by_phase: Dict[Tuple[str, str], List[Request]] = OrderedDict()
+        for r in self.requests:
+            by_phase.setdefault((r.phase, r.kind), []).append(r)
+        stats = []
+        for (phase, kind), requests in by_phase.items():
+            latencies = [r.latency for r in requests]
+            stats.append(PhaseLatency(
+                phase=phase,
+                kind=kind,
+                requests=len(requests),
+                errors=sum(1 for r in requests if r.error),
+                p50=percentile(latencies, 50),
+                p90=percentile(latencies, 90),
+                p99=percentile(latencies, 99),
+                max=max(latencies),
+            ))
+        return stats
+
+    def errors(self) -> Dict[str, int]:
+        """Return the number of occurrences of each error message."""
+        counts: Dict[str, int] = OrderedDict()
+        for r in self.requests:
+            if r.error:
+                counts[r.error] = counts.get(r.error, 0) + 1
+        return counts
@@ -0,0 +1,7 @@
+import os
+
+BENCHMARKS = os.environ.get('CRATE_QA_BENCHMARKS', 'false').lower() == 'true'
+
+
+def env_list(name, default):
+    return [x.strip() for x in os.environ.get(name, default).split(',') if x.strip()]
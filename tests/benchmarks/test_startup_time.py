@@ -0,0 +1,101 @@
+import os
+import time
+import unittest
+from typing import NamedTuple
+from crate.client import connect
+from crate.qa.tests import NodeProvider, CrateCluster, insert_data
+from crate.qa.logs import StartupTimer
+from crate.qa.metrics import summarize, record_results
+from benchmarks import BENCHMARKS, env_list
+
+
+class StartupTiming(NamedTuple):
+    """Seconds from spawning the process until each milestone was reached."""
+    http_ready: float
+    psql_ready: float
+    node_started: float
+    cluster_formed: float
+
+
+CREATE_TABLE = '''
+CREATE TABLE doc.t1 (
+    id INTEGER,
+    col_int INTEGER,
+    col_long LONG,
+    col_double DOUBLE,
+    col_string STRING,
+    col_timestamp TIMESTAMP
+) CLUSTERED INTO 4 SHARDS WITH (number_of_replicas = 0)
+'''
+
+
+@unittest.skipUnless(BENCHMARKS, 'set CRATE_QA_BENCHMARKS=true to run benchmarks')
+class StartupTimeBenchmark(NodeProvider, unittest.TestCase):
+    """Measures how long it takes until a node is ready after it is spawned.
+
+    The matrix of versions, heap sizes and number of rows in the data
+    directory is configured with the ``BENCH_VERSIONS``, ``BENCH_HEAP_SIZES``
+    and ``BENCH_DATA_ROWS`` environment variables. Every combination is
+    started ``BENCH_TRIALS`` times.
+    """
+
+    VERSIONS = env_list('BENCH_VERSIONS', NodeProvider.CRATE_VERSION)
+    HEAP_SIZES = env_list('BENCH_HEAP_SIZES', NodeProvider.CRATE_HEAP_SIZE)
+    DATA_ROWS = [int(x) for x in env_list('BENCH_DATA_ROWS', '0,10000')]
+    TRIALS = int(os.environ.get('BENCH_TRIALS', '3'))
+
+    def test_startup_time(self):
+        for version in self.VERSIONS:
+            for heap_size in self.HEAP_SIZES:
+                for rows in self.DATA_ROWS:
+                    name = f'{version} heap={heap_size} rows={rows}'
+                    with self.subTest(name):
+                        try:
+                            self.setUp()
+                            self.CRATE_HEAP_SIZE = heap_size
+                            self._benchmark(name, version, heap_size, rows)
+                        finally:
+                            self.tearDown()
+
+    def _seed(self, version, rows):
+        (node, _) = self._new_node(version)
+        node.start()
+        with connect(node.http_url, error_trace=True) as conn:
+            c = conn.cursor()
+            c.execute(CREATE_TABLE)
+            insert_data(conn, 'doc', 't1', rows)
+        self._process_on_stop()
+
+    def _start(self, version) -> StartupTiming:
+        (node, _) = self._new_node(version)
+        timer = StartupTimer()
+        node.monitor.consumers.append(timer)
+        spawned = time.monotonic()
+        node.start()
+        cluster = CrateCluster([node])
+        try:
+            cluster.wait_until_ready()
+            formed = time.monotonic()
+        finally:
+            cluster.close_client()
+        node.monitor.consumers.remove(timer)
+        self._process_on_stop()
+        return StartupTiming(
+            http_ready=timer.published['http'] - spawned,
+            psql_ready=timer.published.get('psql', formed) - spawned,
+            node_started=(timer.started or formed) - spawned,
+            cluster_formed=formed - spawned,
+        )
+
+    def _benchmark(self, name, version, heap_size, rows):
+        if rows:
+            self._seed(version, rows)
+        timings = [self._start(version) for _ in range(self.TRIALS)]
+        print(f'# Startup time of {name} ({self.TRIALS} trials)')
+        for milestone in StartupTiming._fields:
+            summary = summarize(getattr(t, milestone) for t in timings)
+            print(f'#   {milestone:15} {summary}')
+        record_results('startup_time', (
+            dict(version=version, heap_size=heap_size, rows=rows, trial=i, **t._asdict())
+            for i, t in enumerate(timings)
+        ))
@@ -0,0 +1,162 @@
+import os
+import time
+import unittest
+from typing import NamedTuple, Optional, Tuple
+from crate.client import connect
+from crate.client.exceptions import ProgrammingError
+from crate.qa.tests import NodeProvider, insert_data, wait_for, shards_started, \
+    stop_node, kill_node
+from crate.qa.recovery import RecoveryTracker
+from crate.qa.metrics import summarize, record_results
+from benchmarks import BENCHMARKS, env_list
+
+
+class ReplayTiming(NamedTuple):
+    """Measurements of a single restart.
+
+    `uncommitted_bytes` and `uncommitted_rows` are the size and number of
+    operations in the translog that weren't committed to Lucene before the
+    restart (`None` for versions without ``translog_stats``).
+    `translog_seconds` is the wall-clock time from the first shard entering
+    the ``TRANSLOG`` stage until the last one left it, `None` if the replay
+    was shorter than the poll interval.
+    """
+    uncommitted_bytes: Optional[int]
+    uncommitted_rows: Optional[int]
+    time_to_ready: float
+    translog_seconds: Optional[float]
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.uncommitted_rows is None or not self.translog_seconds:
+            return None
+        return self.uncommitted_rows / self.translog_seconds
+
+
+def summarize_measured(values) -> str:
+    """Summarize the values that were measured (aren't `None`)."""
+    values = list(values)
+    measured = [v for v in values if v is not None]
+    if not measured:
+        return 'n/a'
+    unmeasured = len(values) - len(measured)
+    return str(summarize(measured)) + (f' ({unmeasured} n/a)' if unmeasured else '')
+
+
+CREATE_TABLE = '''
+CREATE TABLE doc.t1 (
+    id INTEGER,
+    col_int INTEGER,
+    col_long LONG,
+    col_double DOUBLE,
+    col_string STRING,
+    col_timestamp TIMESTAMP
+) CLUSTERED INTO {shards} SHARDS WITH (
+    number_of_replicas = 0,
+    "translog.durability" = '{durability}',
+    "translog.flush_threshold_size" = '{flush_threshold}'
+)
+'''
+
+
+@unittest.skipUnless(BENCHMARKS, 'set CRATE_QA_BENCHMARKS=true to run benchmarks')
+class TranslogReplayBenchmark(NodeProvider, unittest.TestCase):
+    """Measures how long a node needs to replay un-flushed writes on restart.
+
+    Rows are written into a table with the given translog settings, so
+    that they are only in the translog, not in a Lucene commit. Then the
+    node is killed (like a crash) or stopped gracefully and started again.
+    The matrix is configured with ``BENCH_TRANSLOG_ROWS``,
+    ``BENCH_TRANSLOG_DURABILITY``, ``BENCH_TRANSLOG_FLUSH_THRESHOLD`` and
+    ``BENCH_STOP_MODES``; every combination is measured ``BENCH_TRIALS``
+    times.
+    """
+
+    VERSION = os.environ.get('BENCH_VERSION', NodeProvider.CRATE_VERSION)
+    ROWS = [int(x) for x in env_list('BENCH_TRANSLOG_ROWS', '10000,100000')]
+    DURABILITIES = env_list('BENCH_TRANSLOG_DURABILITY', 'request,async')
+    FLUSH_THRESHOLDS = env_list('BENCH_TRANSLOG_FLUSH_THRESHOLD', '512mb')
+    STOP_MODES = env_list('BENCH_STOP_MODES', 'kill,stop')
+    SHARDS = int(os.environ.get('BENCH_TRANSLOG_SHARDS', '4'))
+    TRIALS = int(os.environ.get('BENCH_TRIALS', '3'))
+
+    def test_translog_replay(self):
+        for rows in self.ROWS:
+            for durability in self.DURABILITIES:
+                for flush_threshold in self.FLUSH_THRESHOLDS:
+                    for stop_mode in self.STOP_MODES:
+                        name = (f'rows={rows} durability={durability} '
+                                f'flush_threshold={flush_threshold} stop={stop_mode}')
+                        with self.subTest(name):
+                            self._benchmark(name, rows, durability, flush_threshold, stop_mode)
+
+    def _benchmark(self, name, rows, durability, flush_threshold, stop_mode):
+        timings = []
+        for _ in range(self.TRIALS):
+            try:
+                self.setUp()
+                timings.append(self._trial(rows, durability, flush_threshold, stop_mode))
+            finally:
+                self.tearDown()
+        print(f'# Translog replay of {name} ({self.TRIALS} trials)')
+        print(f'#   time_to_ready     {summarize(t.time_to_ready for t in timings)}')
+        print(f'#   translog_seconds  {summarize_measured(t.translog_seconds for t in timings)}')
+        print(f'#   rows_per_second   {summarize_measured(t.rows_per_second for t in timings)}')
+        print(f'#   uncommitted_rows  {summarize_measured(t.uncommitted_rows for t in timings)}')
+        record_results('translog_replay', (
+            dict(version=self.VERSION,
+                 rows=rows,
+                 durability=durability,
+                 flush_threshold=flush_threshold,
+                 stop_mode=stop_mode,
+                 trial=i,
+                 rows_per_second=t.rows_per_second,
+                 **t._asdict())
+            for i, t in enumerate(timings)
+        ))
+
+    def _uncommitted(self, cursor) -> Tuple[Optional[int], Optional[int]]:
+        """Return the size and number of uncommitted translog operations."""
+        try:
+            cursor.execute('''
+                SELECT sum(translog_stats['uncommitted_size']),
+                       sum(translog_stats['uncommitted_operations'])
+                FROM sys.shards
+                WHERE schema_name = 'doc' AND table_name = 't1'
+            ''')
+        except ProgrammingError:
+            # translog_stats doesn't exist in older versions
+            return None, None
+        return cursor.fetchone()
+
+    def _trial(self, rows, durability, flush_threshold, stop_mode) -> ReplayTiming:
+        (node, _) = self._new_node(self.VERSION)
+        node.start()
+        with connect(node.http_url, error_trace=True) as conn:
+            c = conn.cursor()
+            c.execute(CREATE_TABLE.format(shards=self.SHARDS,
+                                          durability=durability,
+                                          flush_threshold=flush_threshold))
+            insert_data(conn, 'doc', 't1', rows)
+            uncommitted_bytes, uncommitted_rows = self._uncommitted(c)
+        if stop_mode == 'kill':
+            kill_node(node)
+        else:
+            stop_node(node, self.SHUTDOWN_TIMEOUT)
+
+        tracker = RecoveryTracker()
+        started = time.monotonic()
+        node.start()
+        with connect(node.http_url, error_trace=True) as conn:
+            c = conn.cursor()
+            wait_for(c,
+                     shards_started(self.SHARDS, schema='doc', table='t1'),
+                     timeout=60 + rows / 1000,
+                     observers=[tracker])
+            time_to_ready = time.monotonic() - started
+        return ReplayTiming(
+            uncommitted_bytes=uncommitted_bytes,
+            uncommitted_rows=uncommitted_rows,
+            time_to_ready=time_to_ready,
+            translog_seconds=tracker.stage_span('TRANSLOG'),
+        )
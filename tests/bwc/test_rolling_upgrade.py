@@ -1,7 +1,13 @@
+import os
+import random
 import unittest
 from typing import NamedTuple
 from crate.client import connect
-from crate.qa.tests import NodeProvider, insert_data, wait_for_active_shards
+from crate.qa.tests import NodeProvider, insert_data, wait_for_active_shards, \
+    resolve_version, resolved_name, wait_for, nodes_joined
+from crate.qa.workload import BackgroundWorkload
+from crate.qa.recovery import RecoveryTracker
+from crate.qa.metrics import record_results
 
 
 class UpgradePath(NamedTuple):
@@ -19,11 +25,40 @@ ROLLING_UPGRADES = (
 )
 
 
+def get_test_paths():
+    """
+    Generator for the rolling upgrades that upgrade to a different build.
+
+    Upgrades whose versions resolve to the same CrateDB build are skipped,
+    as are upgrades that resolve to the same builds as a previous one.
+    """
+    seen = set()
+    for path in ROLLING_UPGRADES:
+        builds = (resolve_version(path.from_version), resolve_version(path.to_version))
+        if builds[0] == builds[1] or builds in seen:
+            print(f'# Skipping {path}: resolves to '
+                  f'{resolved_name(path.from_version)} -> {resolved_name(path.to_version)}')
+            continue
+        seen.add(builds)
+        yield path
+
+
+READ = 'SELECT type, AVG(value) FROM doc.t1 GROUP BY type'
+WRITE = (
+    'INSERT INTO doc.t1 (type, value) VALUES (?, ?)',
+    lambda: (random.randint(-128, 127), random.random()),
+)
+
+
 class RollingUpgradeTest(NodeProvider, unittest.TestCase):
 
+    # Background load during the upgrade, see `BackgroundWorkload`
+    WORKLOAD_THREADS = int(os.environ.get('CRATE_QA_WORKLOAD_THREADS', '2'))
+    WORKLOAD_WRITE_RATIO = float(os.environ.get('CRATE_QA_WORKLOAD_WRITE_RATIO', '0.2'))
+
     def test_rolling_upgrade(self):
-        for path in ROLLING_UPGRADES:
-            print(path)
+        for path in get_test_paths():
+            print(f'{path} ({resolved_name(path.from_version)} -> {resolved_name(path.to_version)})')
             with self.subTest(repr(path)):
                 try:
                     self.setUp()
@@ -39,13 +74,17 @@ class RollingUpgradeTest(NodeProvider, unittest.TestCase):
         After each upgraded node a SQL statement is executed that involves all
         nodes in the cluster, in order to check if communication between nodes
         is possible.
+
+        During the whole upgrade a background workload issues reads and
+        writes; their latencies and errors are reported per upgrade phase.
         """
 
         shards, replicas = (nodes, 1)
 
         cluster = self._new_cluster(path.from_version, nodes)
         cluster.start()
-        with connect(cluster.node().http_url, error_trace=True) as conn:
+        cluster.wait_until_ready()
+        with cluster.client.connection() as conn:
             c = conn.cursor()
             c.execute(f'''
                 CREATE TABLE doc.t1 (
@@ -56,15 +95,42 @@ class RollingUpgradeTest(NodeProvider, unittest.TestCase):
             ''')
             insert_data(conn, 'doc', 't1', 1000)
 
-        for idx, node in enumerate(cluster):
-            new_node = self.upgrade_node(node, path.to_version)
-            cluster[idx] = new_node
-            with connect(new_node.http_url, error_trace=True) as conn:
-                c = conn.cursor()
-                wait_for_active_shards(c, shards + replicas * shards)
-                c.execute(f'''
-                    SELECT type, AVG(value)
-                    FROM doc.t1
-                    GROUP BY type
-                ''')
-                c.fetchall()
+        workload = BackgroundWorkload(lambda: [n.http_url for n in cluster],
+                                      READ,
+                                      WRITE,
+                                      threads=self.WORKLOAD_THREADS,
+                                      write_ratio=self.WORKLOAD_WRITE_RATIO,
+                                      phase='steady').start()
+        try:
+            for idx, node in enumerate(cluster):
+                new_node = self.upgrade_node(node, path.to_version, on_phase=workload.phase)
+                cluster[idx] = new_node
+                tracker = RecoveryTracker()
+                with connect(new_node.http_url, error_trace=True) as conn:
+                    c = conn.cursor()
+                    wait_for(c, nodes_joined(nodes), observers=[tracker])
+                    workload.phase('recovering')
+                    wait_for_active_shards(c, shards + replicas * shards, observers=[tracker])
+                    workload.phase('steady')
+                    print(f'# Recovery after upgrading node {idx}:')
+                    for line in tracker.summary():
+                        print(f'#   {line}')
+                    c.execute(f'''
+                        SELECT type, AVG(value)
+                        FROM doc.t1
+                        GROUP BY type
+                    ''')
+                    c.fetchall()
+        finally:
+            workload.stop()
+            self._report_workload(path, workload)
+
+    def _report_workload(self, path, workload):
+        print(f'# Background workload during {path}:')
+        for stats in workload.stats():
+            print(f'#   {stats}')
+        for error, count in workload.errors().items():
+            print(f'#   {count:5d}x {error}')
+        record_results('rolling_upgrade_workload', (
+            dict(path=repr(path), **stats._asdict()) for stats in workload.stats()
+        ))
@@ -2,12 +2,21 @@ import os
 import shutil
 import unittest
 import time
-from typing import NamedTuple, Iterable
+from threading import Lock
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import OrderedDict
+from typing import NamedTuple, Iterable, Optional
 from io import BytesIO
-from crate.client import connect
 from crate.client.exceptions import ProgrammingError
 from crate.qa.tests import VersionDef, NodeProvider, \
-    wait_for_active_shards, insert_data, gen_id
+    wait_for, shards_started, insert_data, gen_id, tmpdir_reaper, \
+    resolve_version, resolved_name, create_scaled_tables, scaled_tables, \
+    recoveries_done, segment_stats, SegmentStats, DATA_SEED
+from crate.qa.cache import copy_tree
+from crate.qa.fixtures import FORMAT_VERSION
+from crate.qa.metrics import LatencyMatrix, record_results, summarize
+from crate.qa.recovery import RecoveryTracker
 
 UPGRADE_PATHS = (
     (
@@ -41,7 +50,7 @@ CREATE TABLE t1 (
     col_timestamp TIMESTAMP,
     text STRING,
     INDEX text_ft USING FULLTEXT(text) WITH (analyzer=myanalysis)
-) CLUSTERED INTO 3 SHARDS WITH (number_of_replicas = 0)
+) CLUSTERED INTO {shards} SHARDS WITH (number_of_replicas = 0)
 '''
 
 CREATE_BLOB_TABLE = '''
@@ -66,11 +75,15 @@ class Statement(NamedTuple):
     unsupported_versions: Iterable[str]
 
 
+# Maximum number of rows fetched by statements that return rows of the
+# whole table, so that their results stay small at large data scales
+FETCH_LIMIT = 10000
+
 # Use statements that use different code paths to retrieve the values
 SELECT_STATEMENTS = (
-    Statement('SELECT _id, _uid, * FROM t1', []),
+    Statement(f'SELECT _id, _uid, * FROM t1 LIMIT {FETCH_LIMIT}', []),
     Statement('SELECT * FROM t1 WHERE id = 1', []),
-    Statement('SELECT * FROM t1 WHERE col_ip > \'127.0.0.1\'', []),
+    Statement(f'SELECT * FROM t1 WHERE col_ip > \'127.0.0.1\' LIMIT {FETCH_LIMIT}', []),
     Statement('''
     SELECT
         COUNT(DISTINCT col_byte),
@@ -87,33 +100,111 @@ SELECT_STATEMENTS = (
         'SELECT COUNT(DISTINCT col_ip) FROM t1',
         ['2.0.x', '2.1.x']
     ),
-    Statement('SELECT id, distance(col_geo_point, [0.0, 0.0]) FROM t1', []),
-    Statement('SELECT * FROM t1 WHERE within(col_geo_point, col_geo_shape)', []),
+    Statement(f'SELECT id, distance(col_geo_point, [0.0, 0.0]) FROM t1 LIMIT {FETCH_LIMIT}', []),
+    Statement(f'SELECT * FROM t1 WHERE within(col_geo_point, col_geo_shape) LIMIT {FETCH_LIMIT}', []),
     Statement('SELECT date_trunc(\'week\', col_timestamp), sum(col_int), avg(col_float) FROM t1 GROUP BY 1', []),
     Statement('SELECT _score, text FROM t1 WHERE match(text_ft, \'fase\')', []),
     Statement('UPDATE t1 SET col_int = col_int + 1', []),
 )
 
 
-def run_selects(c, version):
+# Number of times each SELECT statement is timed per version
+LATENCY_REPETITIONS = int(os.environ.get('CRATE_QA_LATENCY_REPETITIONS', '5'))
+
+
+def run_selects(c, version, latencies=None, repetitions=LATENCY_REPETITIONS):
+    """
+    Execute the statements supported by `version` and fetch their results.
+
+    If a LatencyMatrix is given, each SELECT statement is timed
+    `repetitions` times. Other statements modify the data and are executed
+    and timed only once.
+    """
     for stmt in SELECT_STATEMENTS:
         if version in stmt.unsupported_versions:
             continue
-        try:
-            c.execute(stmt.stmt)
-        except ProgrammingError as e:
-            raise ProgrammingError('Error executing ' + stmt.stmt) from e
+        is_select = stmt.stmt.lstrip().upper().startswith('SELECT')
+        for _ in range(repetitions if latencies is not None and is_select else 1):
+            try:
+                started = time.monotonic()
+                c.execute(stmt.stmt)
+                if is_select:
+                    c.fetchall()
+                duration = time.monotonic() - started
+            except ProgrammingError as e:
+                raise ProgrammingError('Error executing ' + stmt.stmt) from e
+            if latencies is not None:
+                latencies.add(version, stmt.stmt, duration)
+
+
+def collapse_path(path):
+    """
+    Merge consecutive versions of a path that resolve to the same CrateDB
+    build, because upgrading a cluster to the build it already runs is a
+    no-op. The segments are upgraded if any of the merged versions requires
+    it.
+    """
+    collapsed = []
+    for version in path:
+        if collapsed and resolve_version(collapsed[-1].version) == resolve_version(version.version):
+            previous = collapsed[-1]
+            collapsed[-1] = VersionDef(
+                previous.version,
+                previous.upgrade_segments or version.upgrade_segments)
+        else:
+            collapsed.append(version)
+    return tuple(collapsed)
+
+
+class SegmentUpgrade(NamedTuple):
+    version: str
+    table: str
+    duration: float
+    before: Optional[SegmentStats]
+    after: Optional[SegmentStats]
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """Bytes of segments that were rewritten per second."""
+        if not self.after or not self.duration:
+            return None
+        return self.after.size / self.duration
+
+    def __str__(self):
+        if not self.before or not self.after:
+            return f'{self.version:15} {self.table:20} {self.duration:8.3f}s'
+        mb = 1024 * 1024
+        return (f'{self.version:15} {self.table:20} {self.duration:8.3f}s  '
+                f'segments: {self.before.segments} -> {self.after.segments}  '
+                f'size: {self.before.size / mb:.1f}MB -> {self.after.size / mb:.1f}MB  '
+                f'{self.throughput / mb:.1f}MB/s')
 
 
 def get_test_paths():
     """
     Generater for all possible upgrade paths that should be tested.
+
+    Versions are resolved up front. Paths without an actual upgrade and
+    paths that resolve to the same builds as a previous path are skipped.
     """
+    seen = set()
     for path in UPGRADE_PATHS:
         for versions in (path[x:] for x in range(len(path) - 1)):
+            versions = collapse_path(versions)
+            builds = tuple(resolve_version(v) for v, _ in versions)
+            if len(versions) < 2 or builds in seen:
+                continue
+            seen.add(builds)
             yield versions
 
 
+def plan_repr(path):
+    """
+    String representation of an upgrade path with the resolved builds.
+    """
+    return ' -> '.join(f'{v} ({resolved_name(v)})' for v, _ in path)
+
+
 def path_repr(path):
     """
     String representation of the upgrade path in the format::
@@ -124,89 +215,318 @@ def path_repr(path):
     return f'{versions[0]} -> {versions[-1]}'
 
 
+class PathNode:
+    """
+    A version step in the tree of upgrade paths.
+
+    Paths that share a prefix share the nodes of that prefix, so that the
+    steps of the prefix only run once.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.children = OrderedDict()
+        self.paths = []
+
+    def add(self, path):
+        node = self
+        for version in path:
+            if version not in node.children:
+                node.children[version] = PathNode(version)
+            node = node.children[version]
+        node.paths.append(path)
+
+    def subtree_paths(self):
+        yield from self.paths
+        for child in self.children.values():
+            yield from child.subtree_paths()
+
+    def num_steps(self):
+        return len(self.children) + sum(c.num_steps() for c in self.children.values())
+
+
+def path_tree(paths):
+    root = PathNode()
+    for path in paths:
+        root.add(path)
+    return root
+
+
 class StorageCompatibilityTest(NodeProvider, unittest.TestCase):
 
     CLUSTER_SETTINGS = {
         'cluster.name': gen_id(),
     }
 
+    # Number of branches of the upgrade path tree that run concurrently
+    PARALLEL_PATHS = int(os.environ.get('CRATE_QA_PARALLEL_PATHS', '1'))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = LatencyMatrix()
+        self.recovery_times = OrderedDict()
+        self.segment_upgrades = []
+
     def test_upgrade_paths(self):
-        for path in get_test_paths():
-            with self.subTest(path_repr(path)):
-                try:
-                    self.setUp()
-                    self._test_upgrade_path(path, nodes=3)
-                finally:
-                    self.tearDown()
-
-    def _upgrade(self, cursor, upgrade_segments, num_retries=3):
+        paths = list(get_test_paths())
+        print(f'# Upgrade plan ({len(paths)} paths):')
+        for path in paths:
+            print(f'#   {plan_repr(path)}')
+        try:
+            self.setUp()
+            errors = self._test_upgrade_paths(paths, nodes=3)
+            for path in paths:
+                with self.subTest(path_repr(path)):
+                    if path in errors:
+                        raise errors[path]
+        finally:
+            self.tearDown()
+            self._report_latencies()
+            self._report_recovery_times()
+            self._report_segment_upgrades()
+
+    def _report_latencies(self):
+        if not self.latencies:
+            return
+        print('# Median query latency in ms per version:')
+        for line in self.latencies.format():
+            print(f'#   {line}')
+        record_results('query_latency', self.latencies.results())
+
+    def _report_segment_upgrades(self):
+        if not self.segment_upgrades:
+            return
+        print('# Segment upgrades:')
+        for upgrade in self.segment_upgrades:
+            print(f'#   {upgrade}')
+        record_results('segment_upgrade', (
+            dict(version=u.version,
+                 table=u.table,
+                 duration=u.duration,
+                 throughput=u.throughput,
+                 before=u.before and u.before._asdict(),
+                 after=u.after and u.after._asdict())
+            for u in self.segment_upgrades
+        ))
+
+    def _report_recovery_times(self):
+        if not self.recovery_times:
+            return
+        print(f'# Seconds from cluster start until all shards are started ({self.DATA_SCALE}):')
+        for version, durations in self.recovery_times.items():
+            print(f'#   {version:15} {summarize(durations)}')
+        record_results('recovery_time', (
+            dict(version=version, seconds=duration, **self.DATA_SCALE._asdict())
+            for version, durations in self.recovery_times.items()
+            for duration in durations
+        ))
+
+    def _upgrade(self, cursor, version, upgrade_segments, num_retries=3):
+        """
+        Performs the upgrade of the segments of all tables.
+        """
+        if not upgrade_segments:
+            return
+        tables = [('doc', 't1'), ('blob', 'b1')]
+        tables += [('doc', name) for name in scaled_tables(self.DATA_SCALE)]
+        for schema, table in tables:
+            self.segment_upgrades.append(
+                self._upgrade_table(cursor, version, schema, table, num_retries))
+
+    def _upgrade_table(self, cursor, version, schema, table, num_retries):
         """
-        Performs the upgrade of the indices and retries in case of
-        ProgrammingErrors.
+        Upgrades the segments of a table and retries in case of a
+        PrimaryMissingActionException.
 
         The retry was added because the wait_for_active shards check
         collects the shard information directly from the nodes. The
         internal ES code, however, retrieves the shard information
-        from the ClusterState. A retry is necessary in case the shards
-        are ready but the cluster state hasn't been updated yet.
+        from the ClusterState. Before a retry the shards of the table must
+        be started and their recoveries must be done again, which gives the
+        cluster state time to catch up.
         """
-        try:
-            if upgrade_segments:
-                cursor.execute('OPTIMIZE TABLE doc.t1 WITH (upgrade_segments = true)')
-                cursor.execute('OPTIMIZE TABLE blob.b1 WITH (upgrade_segments = true)')
-        except ProgrammingError as e:
-            print(f'OPTIMIZE failed: {e.message} (num_retries={num_retries})')
-            if num_retries > 0 and "PrimaryMissingActionException" in e.message:
-                time.sleep(1 / (num_retries + 1))
-                self._upgrade(cursor, upgrade_segments, num_retries - 1)
-            else:
-                raise e
-
-    def _test_upgrade_path(self, versions, nodes):
-        """ Test upgrade path across specified versions.
-
-        Creates a blob and regular table in first version and inserts a record,
-        then goes through all subsequent versions - each time verifying that a
-        few simple selects work.
+        before = segment_stats(cursor, schema, table)
+        started = time.monotonic()
+        for attempt in range(num_retries + 1):
+            try:
+                cursor.execute(f'OPTIMIZE TABLE "{schema}"."{table}" WITH (upgrade_segments = true)')
+                break
+            except ProgrammingError as e:
+                print(f'OPTIMIZE failed: {e.message} (num_retries={num_retries - attempt})')
+                if attempt == num_retries or "PrimaryMissingActionException" not in e.message:
+                    raise e
+                wait_for(cursor,
+                         shards_started(schema=schema, table=table),
+                         recoveries_done(),
+                         timeout=self.DATA_SCALE.timeout)
+        duration = time.monotonic() - started
+        return SegmentUpgrade(version, f'{schema}.{table}', duration, before,
+                              segment_stats(cursor, schema, table))
+
+    def _test_upgrade_paths(self, paths, nodes):
+        """ Test upgrade paths across specified versions.
+
+        Creates a blob and regular table in the first version of each path
+        and inserts a record, then goes through all subsequent versions - each
+        time verifying that a few simple selects work.
+
+        The paths are run as a tree: Steps of a common prefix run only once
+        and the data directory is forked where the tree branches. Branches run
+        concurrently on isolated transport ports if ``PARALLEL_PATHS`` is
+        greater than 1.
+
+        The seeded data directory of the first version is restored from the
+        snapshot cache if it has been created by a previous run.
+
+        Returns the error of each failed path.
         """
-        cluster = self._new_cluster(versions[0][0], nodes, self.CLUSTER_SETTINGS)
-        cluster.start()
-        digest = None
-        with connect(cluster.node().http_url, error_trace=True) as conn:
-            c = conn.cursor()
-            c.execute(CREATE_ANALYZER)
-            c.execute(CREATE_DOC_TABLE)
-            c.execute('''
-                INSERT INTO t1 (id, text) VALUES (0, 'Phase queue is foo!')
-            ''')
-            insert_data(conn, 'doc', 't1', 10)
-            c.execute(CREATE_BLOB_TABLE)
-            run_selects(c, versions[0].version)
-            container = conn.get_blob_container('b1')
-            digest = container.put(BytesIO(b'sample data'))
-            container.get(digest)
-        self._process_on_stop()
-
-        for version, upgrade_segments in versions[1:]:
-            self.assert_data_persistence(version, nodes, upgrade_segments, digest)
-
-        # restart with latest version
-        version, upgrade_segments = versions[-1]
-        self.assert_data_persistence(version, nodes, upgrade_segments, digest)
-
-    def assert_data_persistence(self, version, nodes, upgrade_segments, digest):
-        cluster = self._new_cluster(version, nodes, self.CLUSTER_SETTINGS)
-        cluster.start()
-        with connect(cluster.node().http_url, error_trace=True) as conn:
-            cursor = conn.cursor()
-            wait_for_active_shards(cursor, 6)
-            self._upgrade(cursor, upgrade_segments)
-            cursor.execute('ALTER TABLE doc.t1 SET ("refresh_interval" = 4000)')
-            run_selects(cursor, version)
-            container = conn.get_blob_container('b1')
-            container.get(digest)
-            cursor.execute('ALTER TABLE doc.t1 SET ("refresh_interval" = 2000)')
-        self._process_on_stop()
+        tree = path_tree(paths)
+        if self.DEBUG:
+            print(f'# {len(paths)} upgrade paths, {tree.num_steps()} steps '
+                  f'instead of {sum(len(p) for p in paths)}')
+        errors = {}
+        slots = Queue()
+        for slot in range(self.PARALLEL_PATHS):
+            slots.put(slot)
+        futures = []
+        lock = Lock()
+
+        def run_step(node, data_path, meta):
+            slot = slots.get()
+            transport_port = 4300 + slot * nodes
+            version, upgrade_segments = node.version
+            handed_down = False
+            try:
+                if meta is None:
+                    meta = self._restore_or_seed(
+                        version,
+                        self._fixture(nodes),
+                        lambda: self._seed(version, nodes, data_path, transport_port),
+                        data_path=data_path)
+                else:
+                    self.assert_data_persistence(
+                        version, nodes, upgrade_segments, meta, data_path, transport_port)
+                children = list(node.children.values())
+                # the last child continues on the data directory unless it is
+                # also needed to restart this step's version
+                inherit = children.pop() if children and not node.paths else None
+                for child in children:
+                    child_path = self.mkdtemp(tmpfs=self.DATA_ON_TMPFS)
+                    copy_tree(data_path, child_path)
+                    submit(child, child_path, meta)
+                if inherit:
+                    handed_down = True
+                    submit(inherit, data_path, meta)
+                if node.paths:
+                    # restart with latest version
+                    try:
+                        self.assert_data_persistence(
+                            version, nodes, upgrade_segments, meta, data_path, transport_port)
+                    except Exception as e:
+                        errors.update((path, e) for path in node.paths)
+            except Exception as e:
+                errors.update((path, e) for path in node.subtree_paths())
+            finally:
+                slots.put(slot)
+                if not handed_down:
+                    tmpdir_reaper.remove(data_path)
+
+        with ThreadPoolExecutor(max_workers=self.PARALLEL_PATHS) as executor:
+            def submit(node, data_path, meta):
+                with lock:
+                    futures.append(executor.submit(run_step, node, data_path, meta))
+
+            for node in tree.children.values():
+                submit(node, self.mkdtemp(tmpfs=self.DATA_ON_TMPFS), None)
+            while True:
+                with lock:
+                    pending = [f for f in futures if not f.done()]
+                if not pending:
+                    break
+                wait(pending)
+        return errors
+
+    def _fixture(self, nodes):
+        return {
+            'statements': [CREATE_ANALYZER, CREATE_DOC_TABLE, CREATE_BLOB_TABLE],
+            'scale': self.DATA_SCALE._asdict(),
+            'nodes': nodes,
+            # the generated data depends on these, see `RowGenerator`
+            'seed': DATA_SEED,
+            'data_format': FORMAT_VERSION,
+        }
+
+    def _settings(self, meta, data_path):
+        settings = dict(self.CLUSTER_SETTINGS)
+        settings['cluster.name'] = meta['cluster_name']
+        settings['path.data'] = data_path
+        return settings
+
+    def _seed(self, version, nodes, data_path, transport_port):
+        meta = {
+            'cluster_name': self.CLUSTER_SETTINGS['cluster.name'],
+        }
+        cluster = self._new_cluster(version,
+                                    nodes,
+                                    self._settings(meta, data_path),
+                                    transport_port)
+        try:
+            cluster.start()
+            cluster.wait_until_ready()
+            with cluster.client.connection() as conn:
+                c = conn.cursor()
+                c.execute(CREATE_ANALYZER)
+                c.execute(CREATE_DOC_TABLE.format(shards=self.DATA_SCALE.shards))
+                c.execute('''
+                    INSERT INTO t1 (id, text) VALUES (0, 'Phase queue is foo!')
+                ''')
+                hosts = [n.http_url for n in cluster]
+                insert_data(conn, 'doc', 't1', self.DATA_SCALE.rows, hosts=hosts)
+                create_scaled_tables(conn, self.DATA_SCALE)
+                c.execute(CREATE_BLOB_TABLE)
+                run_selects(c, version)
+                container = conn.get_blob_container('b1')
+                meta['digest'] = container.put(BytesIO(b'sample data'))
+                container.get(meta['digest'])
+        finally:
+            self._stop_cluster(cluster)
+        return meta
+
+    def assert_data_persistence(self, version, nodes, upgrade_segments, meta, data_path, transport_port):
+        cluster = self._new_cluster(version,
+                                    nodes,
+                                    self._settings(meta, data_path),
+                                    transport_port)
+        scale = self.DATA_SCALE
+        tracker = RecoveryTracker()
+        started = time.monotonic()
+        try:
+            cluster.start()
+            cluster.wait_until_ready(timeout=scale.timeout,
+                                     observers=[tracker],
+                                     min_shards=scale.shards + scale.scaled_shards + 3)
+            with cluster.client.connection() as conn:
+                cursor = conn.cursor()
+                wait_for(cursor,
+                         shards_started(scale.shards, schema='doc', table='t1'),
+                         shards_started(scale.shards + scale.scaled_shards, schema='doc'),
+                         shards_started(3, schema='blob', table='b1'),
+                         shards_started(),
+                         timeout=scale.timeout,
+                         observers=[tracker])
+                self.recovery_times.setdefault(version, []).append(time.monotonic() - started)
+                if self.DEBUG:
+                    print(f'# Recovery of {version}:')
+                    for line in tracker.summary():
+                        print(f'#   {line}')
+                self._upgrade(cursor, version, upgrade_segments)
+                cursor.execute('ALTER TABLE doc.t1 SET ("refresh_interval" = 4000)')
+                run_selects(cursor, version, self.latencies)
+                container = conn.get_blob_container('b1')
+                container.get(meta['digest'])
+                cursor.execute('ALTER TABLE doc.t1 SET ("refresh_interval" = 2000)')
+        finally:
+            self._stop_cluster(cluster)
 
 
 class MetaDataCompatibilityTest(NodeProvider, unittest.TestCase):
@@ -229,7 +549,7 @@ class MetaDataCompatibilityTest(NodeProvider, unittest.TestCase):
                                     nodes,
                                     self.CLUSTER_SETTINGS)
         cluster.start()
-        with connect(cluster.node().http_url, error_trace=True) as conn:
+        with cluster.client.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE USER user_a;
@@ -256,7 +576,7 @@ class MetaDataCompatibilityTest(NodeProvider, unittest.TestCase):
                                     nodes,
                                     self.CLUSTER_SETTINGS)
         cluster.start()
-        with connect(cluster.node().http_url, error_trace=True) as conn:
+        with cluster.client.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT name, superuser
@@ -303,7 +623,7 @@ class DefaultTemplateMetaDataCompatibilityTest(NodeProvider, unittest.TestCase):
                                     nodes,
                                     self.CLUSTER_SETTINGS)
         cluster.start()
-        with connect(cluster.node().http_url, error_trace=True) as conn:
+        with cluster.client.connection() as conn:
             cursor = conn.cursor()
             cursor.execute("select 1")
         self._process_on_stop()
@@ -324,7 +644,7 @@ class DefaultTemplateMetaDataCompatibilityTest(NodeProvider, unittest.TestCase):
                                     nodes,
                                     self.CLUSTER_SETTINGS)
         cluster.start()
-        with connect(cluster.node().http_url, error_trace=True) as conn:
+        with cluster.client.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('CREATE TABLE t1 (o object)')
             cursor.execute('''INSERT INTO t1 (o) VALUES ({"name" = 'foo'})''')
@@ -370,7 +690,7 @@ class TableSettingsCompatibilityTest(NodeProvider, unittest.TestCase):
                                     nodes,
                                     self.CLUSTER_SETTINGS)
         cluster.start()
-        with connect(cluster.node().http_url, error_trace=True) as conn:
+        with cluster.client.connection() as conn:
             cursor = conn.cursor()
 
             # The used setting is only valid until version 2.3.x
@@ -393,9 +713,11 @@ class TableSettingsCompatibilityTest(NodeProvider, unittest.TestCase):
                                     nodes,
                                     self.CLUSTER_SETTINGS)
         cluster.start()
-        with connect(cluster.node().http_url, error_trace=True) as conn:
+        with cluster.client.connection() as conn:
             cursor = conn.cursor()
-            wait_for_active_shards(cursor, 8)
+            wait_for(cursor,
+                     shards_started(4, table='t1'),
+                     shards_started(4, table='p1'))
             cursor.execute('''
                 ALTER TABLE t1 SET (number_of_replicas=1)
             ''')
@@ -0,0 +1,64 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from crate.qa.cache import publish_dir
+from crate.qa.fixtures import FixtureStore
+
+
+def write(name, content):
+    def populate(tmp):
+        with open(os.path.join(tmp, name), 'w') as f:
+            f.write(content)
+    return populate
+
+
+class PublishDirTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'sub', 'published')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_publish(self):
+        publish_dir(self.path, write('a', 'x'))
+        self.assertEqual(os.listdir(self.path), ['a'])
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['published'])
+
+    def test_concurrently_published_directory_is_kept(self):
+        def populate(tmp):
+            publish_dir(self.path, write('winner', 'x'))
+            write('loser', 'y')(tmp)
+        publish_dir(self.path, populate)
+        self.assertEqual(os.listdir(self.path), ['winner'])
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['published'])
+
+    def test_errors_are_raised_and_cleaned_up(self):
+        def populate(tmp):
+            write('a', 'x')(tmp)
+            raise OSError('No space left on device')
+        with self.assertRaises(OSError):
+            publish_dir(self.path, populate)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), [])
+
+
+class FixtureStoreTest(unittest.TestCase):
+
+    def test_path_generates_the_dataset_once(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        store = FixtureStore(root)
+        columns = {'id': 'integer', 'name': 'text'}
+        path = store.path(columns, 10, seed=1, files=3)
+        lines = []
+        for name in sorted(os.listdir(path)):
+            with gzip.open(os.path.join(path, name), 'rt') as f:
+                lines.extend(f.read().splitlines())
+        self.assertEqual(len(lines), 10)
+        mtime = os.stat(path).st_mtime
+        self.assertEqual(store.path(columns, 10, seed=1, files=3), path)
+        self.assertEqual(os.stat(path).st_mtime, mtime)
+        self.assertNotEqual(store.path(columns, 10, seed=2, files=3), path)
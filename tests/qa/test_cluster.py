@@ -0,0 +1,69 @@
+import time
+import unittest
+from threading import Event
+from crate.qa.tests import CrateCluster, NodeStartupError
+
+
+class FakeProcess:
+
+    pid = 4711
+
+    def __init__(self):
+        self.killed = Event()
+
+    def poll(self):
+        return -9 if self.killed.is_set() else None
+
+    def kill(self):
+        self.killed.set()
+
+    def terminate(self):
+        self.killed.set()
+
+    def wait(self, timeout=None):
+        return -9
+
+
+class FakeNode:
+    """Node whose start fails after `fail_after` seconds or blocks until it
+    is killed."""
+
+    http_url = None
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.process = None
+        self.stopped = False
+
+    def start(self):
+        self.process = FakeProcess()
+        if self.fail_after is not None:
+            time.sleep(self.fail_after)
+            raise NodeStartupError('n', [('index', 'CorruptIndexException')], [])
+        if not self.process.killed.wait(10):
+            return
+        raise SystemExit("Exiting because CrateDB didn't start correctly")
+
+    def stop(self):
+        self.stopped = True
+
+
+class CrateClusterStartTest(unittest.TestCase):
+
+    def test_start_fails_fast_with_the_first_error(self):
+        nodes = [FakeNode(), FakeNode(fail_after=0.05), FakeNode()]
+        started = time.monotonic()
+        with self.assertRaises(NodeStartupError):
+            CrateCluster(nodes).start()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(all(n.stopped for n in nodes))
+        self.assertTrue(all(n.process.killed.is_set() for n in nodes if n.fail_after is None))
+
+    def test_start(self):
+        class StartedNode(FakeNode):
+            def start(self):
+                self.process = FakeProcess()
+
+        nodes = [StartedNode(), StartedNode()]
+        CrateCluster(nodes).start()
+        self.assertFalse(any(n.stopped for n in nodes))
@@ -0,0 +1,30 @@
+import unittest
+from crate.qa.tests import DataScale, DATA_SCALES, data_scale
+
+
+class DataScaleTest(unittest.TestCase):
+
+    def test_presets(self):
+        for name, scale in DATA_SCALES.items():
+            self.assertEqual(data_scale(name), scale)
+
+    def test_overrides(self):
+        self.assertEqual(data_scale(' medium , rows = 5000,partitions=0 '),
+                         DataScale(rows=5000, shards=6, tables=2, partitions=0))
+
+    def test_invalid_specs(self):
+        for spec, message in (('huge', 'valid presets: small, medium, large'),
+                              ('', 'unknown preset'),
+                              ('small,row=5', 'valid keys: rows, shards, tables, partitions'),
+                              ('small,rows', 'rows must be an integer'),
+                              ('small,rows=many', 'rows must be an integer')):
+            with self.subTest(spec):
+                with self.assertRaisesRegex(ValueError, message):
+                    data_scale(spec)
+
+    def test_scaled_shards(self):
+        self.assertEqual(DataScale(rows=10, shards=3, tables=0, partitions=0).scaled_shards, 0)
+        self.assertEqual(DataScale(rows=10, shards=3, tables=2, partitions=0).scaled_shards, 6)
+        self.assertEqual(DataScale(rows=10, shards=3, tables=2, partitions=4).scaled_shards, 24)
+        # there can't be more partitions than rows
+        self.assertEqual(DataScale(rows=2, shards=3, tables=1, partitions=4).scaled_shards, 6)
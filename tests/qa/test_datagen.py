@@ -0,0 +1,20 @@
+import re
+import unittest
+from crate.qa.datagen import RowGenerator
+
+POINT_RE = re.compile(r'(-?[\d.]+(?:e-?\d+)?) (-?[\d.]+(?:e-?\d+)?)')
+
+
+class RowGeneratorTest(unittest.TestCase):
+
+    def test_geo_shapes_are_within_bounds(self):
+        rows = RowGenerator({'shape': 'geo_shape'}, seed=0).generate(200000)
+        for shape, in rows:
+            for lon, lat in POINT_RE.findall(shape):
+                self.assertTrue(-180 <= float(lon) <= 180, shape)
+                self.assertTrue(-90 <= float(lat) <= 90, shape)
+
+    def test_same_seed_generates_same_rows(self):
+        columns = {'id': 'integer', 'name': 'text', 'tags': 'array(text)'}
+        self.assertEqual(RowGenerator(columns, seed=1).generate(100),
+                         RowGenerator(columns, seed=1).generate(100))
@@ -0,0 +1,47 @@
+import unittest
+from crate.qa.logs import LogWatcher
+
+STARTUP_LOG = '''
+[2020-03-02T10:15:01,112][INFO ][o.e.e.NodeEnvironment    ] [node-0] using [1] data paths, mounts [[/ (overlay)]], net usable_space [41.6gb], net total_space [58.4gb], types [overlay]
+[2020-03-02T10:15:01,114][INFO ][o.e.e.NodeEnvironment    ] [node-0] heap size [1gb], compressed ordinary object pointers [true]
+[2020-03-02T10:15:01,153][INFO ][o.e.n.Node               ] [node-0] node name [node-0], node ID [4ixfx8TbQbO9TfL2N6N1aQ]
+[2020-03-02T10:15:01,154][INFO ][o.e.n.Node               ] [node-0] version[4.1.2], pid[4711], build[6e3b1a3/2020-02-11T14:25:59Z], OS[Linux/5.4.0/amd64], JVM[AdoptOpenJDK/OpenJDK 64-Bit Server VM/13.0.1/13.0.1+9]
+[2020-03-02T10:15:01,155][INFO ][o.e.n.Node               ] [node-0] JVM arguments [-Xms1g, -Xmx1g, -XX:+UseG1GC, -XX:G1ReservePercent=25, -XX:InitiatingHeapOccupancyPercent=30, -Xlog:gc*,gc+age=trace,safepoint:file=/crate/logs/gc.log:utctime,pid,tags:filecount=32,filesize=64m, -XX:+HeapDumpOnOutOfMemoryError, -XX:HeapDumpPath=/crate/data, -XX:ErrorFile=/crate/logs/hs_err_pid%p.log, -XX:+ExitOnOutOfMemoryError, -Des.path.home=/crate, -Des.path.conf=/crate/config, -Des.distribution.type=tar]
+[2020-03-02T10:15:03,470][INFO ][o.e.p.PluginsService     ] [node-0] no modules loaded
+[2020-03-02T10:15:03,471][INFO ][o.e.p.PluginsService     ] [node-0] loaded plugin [crate-jmx-monitoring]
+[2020-03-02T10:15:05,021][INFO ][o.e.d.DiscoveryModule    ] [node-0] using discovery type [zen] and seed hosts providers [settings]
+[2020-03-02T10:15:05,812][INFO ][psql                     ] [node-0] PSQL SSL support is disabled.
+[2020-03-02T10:15:06,102][INFO ][i.c.p.h.CrateNettyHttpServerTransport] [node-0] publish_address {127.0.0.1:4200}, bound_addresses {[::1]:4200}, {127.0.0.1:4200}
+[2020-03-02T10:15:06,118][INFO ][o.e.t.TransportService   ] [node-0] publish_address {127.0.0.1:4300}, bound_addresses {[::1]:4300}, {127.0.0.1:4300}
+[2020-03-02T10:15:06,130][INFO ][o.e.b.BootstrapChecks    ] [node-0] bound or publishing to a non-loopback address, enforcing bootstrap checks
+[2020-03-02T10:15:06,204][INFO ][psql                     ] [node-0] publish_address {127.0.0.1:5432}, bound_addresses {[::1]:5432}, {127.0.0.1:5432}
+[2020-03-02T10:15:06,211][INFO ][o.e.n.Node               ] [node-0] started
+[2020-03-02T10:15:09,218][INFO ][o.e.c.s.MasterService    ] [node-0] elected-as-master ([1] nodes joined)[{node-0}{4ixfx8TbQbO9TfL2N6N1aQ}{127.0.0.1}{127.0.0.1:4300} elect leader], term: 1, version: 1
+[2020-03-02T10:15:09,421][INFO ][o.e.g.GatewayService     ] [node-0] recovered [0] indices into cluster_state
+'''.strip().splitlines()
+
+
+class FakeNode:
+    process = None
+
+
+class LogWatcherTest(unittest.TestCase):
+
+    def _watch(self, lines):
+        watcher = LogWatcher(FakeNode())
+        watcher.arm()
+        for line in lines:
+            watcher.send(line + '\n')
+        return [kind for kind, _ in watcher.matches]
+
+    def test_normal_startup_log_does_not_match(self):
+        self.assertEqual(self._watch(STARTUP_LOG), [])
+
+    def test_out_of_memory_error_matches(self):
+        self.assertEqual(self._watch([
+            '[2020-03-02T10:15:06,130][ERROR][o.e.b.CrateDBUncaughtExceptionHandler] [node-0] fatal error in thread [main], exiting',
+            'java.lang.OutOfMemoryError: Java heap space',
+        ]), ['startup'])
+        self.assertEqual(self._watch([
+            'Exception in thread "Thread-2" java.lang.OutOfMemoryError: Java heap space',
+        ]), ['startup'])
@@ -0,0 +1,57 @@
+import unittest
+from crate.qa.metrics import percentile, summarize, LatencyMatrix
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            percentile([], 50)
+
+    def test_single_value(self):
+        for p in (0, 50, 99, 100):
+            self.assertEqual(percentile([7], p), 7)
+
+    def test_nearest_rank(self):
+        values = list(range(100, 0, -1))
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 1), 1)
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 99.5), 100)
+        self.assertEqual(percentile(values, 100), 100)
+
+    def test_summarize_single_value(self):
+        summary = summarize([2.0])
+        self.assertEqual((summary.n, summary.stdev, summary.p99), (1, 0.0, 2.0))
+
+
+class LatencyMatrixTest(unittest.TestCase):
+
+    def test_empty(self):
+        matrix = LatencyMatrix()
+        self.assertFalse(matrix)
+        self.assertEqual(list(matrix.results()), [])
+
+    def test_combines_measurements(self):
+        matrix = LatencyMatrix()
+        matrix.add('3.0', 'SELECT 1', 0.001)
+        matrix.add('4.0', 'SELECT 1', 0.004)
+        matrix.add('3.0', 'SELECT 1', 0.003)
+        matrix.add('4.0', 'SELECT\n    2', 0.002)
+        self.assertTrue(matrix)
+        self.assertEqual(matrix.versions, ['3.0', '4.0'])
+        self.assertEqual(matrix.summary('3.0', 'SELECT 1').n, 2)
+        self.assertAlmostEqual(matrix.summary('3.0', 'SELECT 1').median, 0.002)
+        results = {(r['version'], r['statement']): r for r in matrix.results()}
+        self.assertEqual(set(results), {('3.0', 'SELECT 1'), ('4.0', 'SELECT 1'), ('4.0', 'SELECT 2')})
+
+    def test_format(self):
+        matrix = LatencyMatrix()
+        matrix.add('3.0', 'SELECT 1', 0.001)
+        matrix.add('4.0', 'SELECT ' + 'x' * 100, 0.002)
+        header, first, second = matrix.format(width=20)
+        self.assertEqual(header.split(), ['3.0', '4.0'])
+        self.assertEqual(first.split(), ['SELECT', '1', '1.00', '-'])
+        self.assertTrue(second.startswith('SELECT xxxxxxxxx...'))
+        self.assertEqual(second.split()[-2:], ['-', '2.00'])
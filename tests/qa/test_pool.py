@@ -0,0 +1,124 @@
+import json
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Barrier, Thread
+from crate.qa.pool import ClusterClient, ROUND_ROBIN, LEAST_LOADED
+
+
+class FakeCrateHandler(BaseHTTPRequestHandler):
+    """Answers the requests of the crate client like a CrateDB node."""
+
+    def _respond(self, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._respond({'ok': True, 'status': 200, 'name': self.server.name,
+                       'version': {'number': '4.0.0'}})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests += 1
+        self._respond({'cols': ['name'], 'rows': [[self.server.name]], 'rowcount': 1, 'duration': 1})
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeNode:
+
+    def __init__(self, name):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCrateHandler)
+        self.server.name = name
+        self.server.requests = 0
+        self.http_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ClusterClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes = [FakeNode(f'n{x}') for x in range(3)]
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.close()
+
+    def _query(self, conn):
+        c = conn.cursor()
+        c.execute('SELECT name FROM sys.nodes')
+        return c.fetchone()[0]
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            ClusterClient(self.nodes, 'random')
+
+    def test_round_robin_spreads_requests_over_all_nodes(self):
+        client = ClusterClient(self.nodes, ROUND_ROBIN)
+        served = Counter()
+        for _ in range(9):
+            with client.connection() as conn:
+                served[self._query(conn)] += 1
+        client.close()
+        self.assertEqual(served, {'n0': 3, 'n1': 3, 'n2': 3})
+
+    def test_round_robin_shares_one_connection(self):
+        client = ClusterClient(self.nodes, ROUND_ROBIN)
+        with client.connection() as a, client.connection() as b:
+            self.assertIs(a, b)
+        client.close()
+
+    def test_least_loaded_leases_the_node_with_fewest_leases(self):
+        client = ClusterClient(self.nodes, LEAST_LOADED)
+        with client.connection() as a, client.connection() as b:
+            with client.connection() as c:
+                self.assertEqual(sorted(self._query(x) for x in (a, b, c)), ['n0', 'n1', 'n2'])
+            # the lease of the third node was returned
+            with client.connection() as d:
+                self.assertIs(d, c)
+            with client.connection() as d, client.connection() as e:
+                self.assertIs(d, c)
+                self.assertIn(self._query(e), ('n0', 'n1'))
+        # connections stay open between leases
+        with client.connection() as again:
+            self.assertIs(again, a)
+        client.close()
+        self.assertEqual(client._leases, [0, 0, 0])
+
+    def test_least_loaded_spreads_concurrent_requests(self):
+        client = ClusterClient(self.nodes, LEAST_LOADED)
+        # every worker holds its lease until all of them leased a node
+        leased = Barrier(3, timeout=10)
+
+        def work():
+            for _ in range(5):
+                with client.connection() as conn:
+                    leased.wait()
+                    self._query(conn)
+                leased.wait()
+        threads = [Thread(target=work) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        client.close()
+        self.assertEqual([n.server.requests for n in self.nodes], [5, 5, 5])
+
+    def test_close_reopens_connections_on_demand(self):
+        client = ClusterClient(self.nodes, ROUND_ROBIN)
+        with client.connection() as conn:
+            self._query(conn)
+        client.close()
+        with client.connection() as again:
+            self.assertIsNot(again, conn)
+            self._query(again)
+        client.close()
@@ -0,0 +1,106 @@
+import unittest
+from unittest import mock
+from crate.qa.recovery import ShardRecovery, RecoveryTracker
+
+
+def shard(id, state, stage=None, primary=True, recovered=0, total_time=None, type='PEER'):
+    return ShardRecovery('doc', 't1', '', id, primary, 'n1', state, stage, type,
+                         1000, recovered, 10, 5, total_time)
+
+
+class ShardRecoveryTest(unittest.TestCase):
+
+    def test_label(self):
+        self.assertEqual(shard(0, 'UNASSIGNED').label, 'UNASSIGNED')
+        self.assertEqual(shard(0, 'INITIALIZING', 'TRANSLOG').label, 'TRANSLOG')
+        self.assertEqual(shard(0, 'INITIALIZING').label, 'INIT')
+        self.assertEqual(shard(0, 'INITIALIZING', 'DONE').label, 'INIT')
+        self.assertEqual(shard(0, 'STARTED', 'DONE').label, 'DONE')
+        self.assertEqual(shard(0, 'RELOCATING', 'DONE').label, 'DONE')
+
+
+class RecoveryTrackerTest(unittest.TestCase):
+
+    def _track(self, polls):
+        """Feed (seconds, rows) polls into a tracker with a fake clock."""
+        with mock.patch('crate.qa.recovery.time.monotonic', return_value=100.0):
+            tracker = RecoveryTracker()
+        for t, rows in polls:
+            with mock.patch('crate.qa.recovery.time.monotonic', return_value=100.0 + t):
+                tracker.observe(rows)
+        return tracker
+
+    def test_stages_are_attributed_to_the_time_between_polls(self):
+        tracker = self._track([
+            (0.0, [shard(0, 'UNASSIGNED'), shard(1, 'STARTED', 'DONE')]),
+            (1.0, [shard(0, 'INITIALIZING', 'INDEX', recovered=200), shard(1, 'STARTED', 'DONE')]),
+            (3.0, [shard(0, 'INITIALIZING', 'TRANSLOG', recovered=1000), shard(1, 'STARTED', 'DONE')]),
+            (3.5, [shard(0, 'STARTED', 'DONE', recovered=1000, total_time=2400),
+                   shard(1, 'STARTED', 'DONE')]),
+        ])
+        stats = tracker.shard_stats()
+        # shard 1 was started before tracking began
+        self.assertEqual(len(stats), 1)
+        s = stats[0]
+        self.assertEqual(s.shard, 'doc.t1[0]p')
+        self.assertEqual(s.stages, {'UNASSIGNED': 1.0, 'INDEX': 2.0, 'TRANSLOG': 0.5})
+        self.assertEqual((s.bytes, s.files, s.type), (1000, 5, 'PEER'))
+        self.assertEqual(s.seconds, 2.4)
+        self.assertAlmostEqual(s.throughput, 1000 / 2.4)
+
+    def test_timeline_only_records_changes(self):
+        rows = [shard(0, 'INITIALIZING', 'INDEX', recovered=10)]
+        tracker = self._track([
+            (0.0, rows),
+            (0.5, rows),
+            (1.0, [shard(0, 'STARTED', 'DONE', recovered=10)]),
+        ])
+        self.assertEqual(tracker.timeline, [
+            (0.0, {'INDEX': 1}, 10),
+            (1.0, {'DONE': 1}, 10),
+        ])
+
+    def test_primaries_and_replicas_are_tracked_separately(self):
+        tracker = self._track([
+            (0.0, [shard(0, 'INITIALIZING', 'INDEX'), shard(0, 'UNASSIGNED', primary=False)]),
+            (2.0, [shard(0, 'STARTED', 'DONE'), shard(0, 'INITIALIZING', 'INDEX', primary=False)]),
+            (3.0, [shard(0, 'STARTED', 'DONE'), shard(0, 'STARTED', 'DONE', primary=False)]),
+        ])
+        stats = {s.shard: s for s in tracker.shard_stats()}
+        self.assertEqual(stats['doc.t1[0]p'].stages, {'INDEX': 2.0})
+        self.assertEqual(stats['doc.t1[0]r'].stages, {'UNASSIGNED': 2.0, 'INDEX': 1.0})
+        self.assertEqual(stats['doc.t1[0]r'].seconds, 3.0)
+
+    def test_summary(self):
+        self.assertEqual(self._track([(0.0, [shard(0, 'STARTED', 'DONE')])]).summary(), [])
+        tracker = self._track([
+            (0.0, [shard(x, 'INITIALIZING', 'INDEX') for x in range(3)]),
+            (1.0, [shard(x, 'STARTED', 'DONE', recovered=1024 * 1024, total_time=1000 * (x + 1))
+                   for x in range(3)]),
+        ])
+        lines = tracker.summary(max_shards=2)
+        self.assertEqual(lines[0], 'Recovered 3 shard copies, 3.0MB in 1.000s (3.0MB/s)')
+        self.assertEqual(lines[1], 'Shard seconds per state: INDEX: 3.000s')
+        self.assertTrue(lines[2].lstrip().startswith('doc.t1[2]p'))
+        self.assertTrue(lines[3].lstrip().startswith('doc.t1[1]p'))
+        self.assertEqual(lines[4], 'Timeline:')
+        self.assertEqual(len(lines), 7)
+
+    def test_stage_span(self):
+        tracker = self._track([
+            (0.0, [shard(0, 'INITIALIZING', 'INDEX'), shard(1, 'INITIALIZING', 'INDEX')]),
+            (0.5, [shard(0, 'INITIALIZING', 'TRANSLOG'), shard(1, 'INITIALIZING', 'TRANSLOG')]),
+            (1.5, [shard(0, 'STARTED', 'DONE'), shard(1, 'INITIALIZING', 'TRANSLOG')]),
+            (2.5, [shard(0, 'STARTED', 'DONE'), shard(1, 'STARTED', 'DONE')]),
+        ])
+        # wall-clock time, not the sum of both shards (3s)
+        self.assertEqual(tracker.stage_span('TRANSLOG'), 2.0)
+        self.assertEqual(tracker.stage_span('INDEX'), 0.5)
+        self.assertIsNone(tracker.stage_span('FINALIZE'))
+
+    def test_stage_span_shorter_than_a_poll(self):
+        tracker = self._track([
+            (0.0, [shard(0, 'INITIALIZING', 'INDEX')]),
+            (1.0, [shard(0, 'STARTED', 'DONE')]),
+        ])
+        self.assertIsNone(tracker.stage_span('TRANSLOG'))
@@ -0,0 +1,60 @@
+import os
+import unittest
+from crate.qa.resources import NodeSampler, read_proc, proc_available
+
+
+class FakeProcess:
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+
+class FakeNode:
+
+    def __init__(self, pid):
+        self.process = FakeProcess(pid)
+
+
+@unittest.skipUnless(proc_available(), 'requires /proc')
+class NodeSamplerTest(unittest.TestCase):
+
+    def test_read_proc(self):
+        sample = read_proc(os.getpid())
+        self.assertGreater(sample.rss_bytes, 0)
+        self.assertGreater(sample.open_files, 0)
+        self.assertGreaterEqual(sample.cpu_seconds, 0)
+
+    def test_samples_are_assigned_to_phases(self):
+        sampler = NodeSampler(FakeNode(os.getpid()))
+        sampler._sample()  # baseline, not recorded
+        sampler._sample()
+        sampler._sample()
+        sampler.phase('workload')
+        sampler._sample()
+        sampler.phase('start')
+        sampler._sample()
+        stats = {s.phase: s for s in sampler.stats()}
+        self.assertEqual(list(stats), ['start', 'workload', 'total'])
+        self.assertEqual(stats['start'].samples, 3)
+        self.assertEqual(stats['workload'].samples, 1)
+        self.assertEqual(stats['total'].samples, 4)
+        self.assertGreater(stats['total'].rss_peak, 0)
+
+    def test_restarted_process_starts_a_new_baseline(self):
+        node = FakeNode(os.getpid())
+        sampler = NodeSampler(node)
+        sampler._sample()
+        node.process.returncode = 0
+        sampler._sample()
+        node.process = FakeProcess(os.getpid())
+        sampler._sample()
+        self.assertEqual(len(sampler.time), 0)
+        sampler._sample()
+        self.assertEqual(len(sampler.time), 1)
+
+    def test_no_samples(self):
+        self.assertEqual(NodeSampler(FakeNode(os.getpid())).stats(), [])
@@ -0,0 +1,100 @@
+import unittest
+from crate.qa.tests import SchemaCache
+
+
+class FakeCluster:
+    """Answers the queries of `columns_for_table` and counts them."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.queries = 0
+
+
+class FakeCursor:
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self._rows = []
+
+    def execute(self, stmt, args=None):
+        if 'sys.nodes' in stmt:
+            self._rows = [('4.0.0',)]
+        else:
+            self.cluster.queries += 1
+            schema, table = args
+            self._rows = list(self.cluster.columns.get((schema, table), {}).items())
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeClient:
+
+    def __init__(self, servers):
+        self.server_pool = {s: None for s in servers}
+
+
+class FakeConnection:
+
+    def __init__(self, cluster, servers, version='4.0.0'):
+        self.cluster = cluster
+        self.client = FakeClient(servers)
+        self.lowest_server_version = version
+
+    def cursor(self):
+        return FakeCursor(self.cluster)
+
+
+class SchemaCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster = FakeCluster({
+            ('doc', 't1'): {'id': 'integer', 'name': 'text'},
+            ('doc', 't2'): {'x': 'integer'},
+        })
+        self.cache = SchemaCache()
+
+    def conn(self, servers=('http://n1:4200', 'http://n2:4200/'), version='4.0.0'):
+        return FakeConnection(self.cluster, servers, version)
+
+    def test_entries_are_shared_by_connections_to_the_same_servers(self):
+        entry = self.cache.get(self.conn(), 'doc', 't1')
+        self.assertEqual(list(entry.columns), ['id', 'name'])
+        self.assertEqual(entry.insert_stmt, 'insert into "doc"."t1" ("id", "name") values (?, ?)')
+        self.cache.get(self.conn(servers=('http://n2:4200', 'http://n1:4200')), 'doc', 't1')
+        self.assertEqual(self.cluster.queries, 1)
+        self.cache.get(self.conn(servers=('http://n1:4200',)), 'doc', 't1')
+        self.assertEqual(self.cluster.queries, 2)
+
+    def test_other_server_version_is_a_miss(self):
+        self.cache.get(self.conn(), 'doc', 't1')
+        self.cache.get(self.conn(version='4.1.0'), 'doc', 't1')
+        self.assertEqual(self.cluster.queries, 2)
+
+    def test_unknown_tables_are_not_cached(self):
+        self.assertEqual(self.cache.get(self.conn(), 'doc', 't3').columns, {})
+        self.cluster.columns[('doc', 't3')] = {'y': 'text'}
+        self.assertEqual(list(self.cache.get(self.conn(), 'doc', 't3').columns), ['y'])
+
+    def test_invalidate(self):
+        for table in ('t1', 't2'):
+            self.cache.get(self.conn(), 'doc', table)
+            self.cache.get(self.conn(servers=('http://n3:4200',)), 'doc', table)
+        self.assertEqual(self.cluster.queries, 4)
+
+        self.cache.invalidate(server='http://n2:4200/', table='t1')
+        self.cache.get(self.conn(), 'doc', 't1')
+        self.cache.get(self.conn(), 'doc', 't2')
+        self.cache.get(self.conn(servers=('http://n3:4200',)), 'doc', 't1')
+        self.assertEqual(self.cluster.queries, 5)
+
+        self.cache.invalidate(server='http://n1:4200')
+        self.cache.get(self.conn(), 'doc', 't2')
+        self.assertEqual(self.cluster.queries, 6)
+
+        self.cache.invalidate()
+        self.cache.get(self.conn(servers=('http://n3:4200',)), 'doc', 't2')
+        self.assertEqual(self.cluster.queries, 7)
@@ -0,0 +1,137 @@
+import os
+import time
+import unittest
+from threading import Lock
+from unittest import mock
+from crate.qa.tests import VersionDef
+from bwc import test_upgrade as upgrade
+
+A, B, C, D = (VersionDef(v, False) for v in ('a', 'b', 'c', 'd'))
+
+BUILDS = {
+    'a': 'crate-1.0.0',
+    'a.x': 'crate-1.0.0',
+    'b': 'crate-2.0.0',
+    'c': 'crate-3.0.0',
+    'd': 'crate-4.0.0',
+}
+
+
+def history(data_path):
+    try:
+        with open(os.path.join(data_path, 'steps')) as f:
+            return f.read().split()
+    except FileNotFoundError:
+        return []
+
+
+def record_step(data_path, version):
+    with open(os.path.join(data_path, 'steps'), 'a') as f:
+        f.write(version + '\n')
+
+
+@mock.patch.object(upgrade, 'resolve_version', BUILDS.__getitem__)
+class PathsTest(unittest.TestCase):
+
+    def test_collapse_path(self):
+        path = (A, VersionDef('a.x', True), B, C)
+        self.assertEqual(upgrade.collapse_path(path), (VersionDef('a', True), B, C))
+        self.assertEqual(upgrade.collapse_path((A, B)), (A, B))
+
+    def test_get_test_paths(self):
+        paths = ((A, B, C), (VersionDef('a.x', False), B, C), (A, A))
+        with mock.patch.object(upgrade, 'UPGRADE_PATHS', paths):
+            self.assertEqual(list(upgrade.get_test_paths()), [(A, B, C), (B, C)])
+
+    def test_path_tree_shares_prefixes(self):
+        paths = [(A, B, C), (A, B, D), (B, C)]
+        tree = upgrade.path_tree(paths)
+        self.assertEqual(list(tree.children), [A, B])
+        a = tree.children[A]
+        self.assertEqual(list(a.children), [B])
+        self.assertEqual(list(a.children[B].children), [C, D])
+        self.assertEqual(a.children[B].children[D].paths, [(A, B, D)])
+        self.assertEqual(tree.num_steps(), 6)
+        self.assertEqual(list(tree.subtree_paths()), paths)
+
+
+class UpgradePathsExecutorTest(unittest.TestCase):
+    """Runs `_test_upgrade_paths` with stubbed clusters.
+
+    Every step appends its version to a file in the data directory, so the
+    history of the data a step runs on shows which steps ran on it.
+    """
+
+    def setUp(self):
+        self.test = upgrade.StorageCompatibilityTest('test_upgrade_paths')
+        self.test.DATA_ON_TMPFS = False
+        self.steps = []
+        self.active_ports = set()
+        self.lock = Lock()
+        self.failing = set()
+        self.test._restore_or_seed = self._restore_or_seed
+        self.test.assert_data_persistence = self._assert_data_persistence
+
+    def _restore_or_seed(self, version, fixture, seed, data_path=None):
+        record_step(data_path, version)
+        with self.lock:
+            self.steps.append(('seed', version, []))
+        return {'digest': 'x'}
+
+    def _assert_data_persistence(self, version, nodes, upgrade_segments, meta, data_path, transport_port):
+        with self.lock:
+            self.assertNotIn(transport_port, self.active_ports)
+            self.active_ports.add(transport_port)
+            self.steps.append((transport_port, version, history(data_path)))
+        try:
+            time.sleep(0.01)
+            if version in self.failing:
+                raise AssertionError(f'{version} failed')
+            record_step(data_path, version)
+        finally:
+            with self.lock:
+                self.active_ports.remove(transport_port)
+
+    def _run(self, paths, parallel=1):
+        self.test.PARALLEL_PATHS = parallel
+        return self.test._test_upgrade_paths(paths, nodes=3)
+
+    def test_shared_prefixes_run_once_on_forked_data(self):
+        errors = self._run([(A, B, C), (A, B, D)])
+        self.assertEqual(errors, {})
+        self.assertEqual([s[:2] for s in self.steps[:2]], [('seed', 'a'), (4300, 'b')])
+        runs = [(version, steps) for _, version, steps in self.steps[2:]]
+        # each branch runs on a copy of the data after b, plus the restart
+        self.assertCountEqual(runs, [
+            ('c', ['a', 'b']), ('c', ['a', 'b', 'c']),
+            ('d', ['a', 'b']), ('d', ['a', 'b', 'd']),
+        ])
+
+    def test_paths_that_end_within_another_path(self):
+        errors = self._run([(A, B), (A, B, C)])
+        self.assertEqual(errors, {})
+        runs = [(version, steps) for _, version, steps in self.steps[1:]]
+        self.assertEqual(runs[0], ('b', ['a']))
+        self.assertCountEqual(runs[1:], [
+            ('b', ['a', 'b']),  # restart at the end of a -> b
+            ('c', ['a', 'b']),
+            ('c', ['a', 'b', 'c']),
+        ])
+
+    def test_errors_are_reported_for_the_subtree(self):
+        self.failing.add('b')
+        paths = [(A, B, C), (A, B, D), (A, C)]
+        errors = self._run(paths)
+        self.assertEqual(set(errors), {(A, B, C), (A, B, D)})
+        self.assertEqual(
+            sorted(version for _, version, _ in self.steps),
+            ['a', 'b', 'c', 'c'])
+
+    def test_parallel_branches_use_separate_ports(self):
+        paths = [(A, B, C), (A, B, D), (A, C, D), (B, D)]
+        errors = self._run(paths, parallel=2)
+        self.assertEqual(errors, {})
+        ports = {port for port, _, _ in self.steps if port != 'seed'}
+        self.assertLessEqual(ports, {4300, 4303})
+        leaves = [steps for _, version, steps in self.steps if steps[-1:] == [version]]
+        self.assertCountEqual(leaves, [['a', 'b', 'c'], ['a', 'b', 'd'], ['a', 'c', 'd'], ['b', 'd']])
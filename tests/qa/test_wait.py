@@ -0,0 +1,92 @@
+import unittest
+from crate.client.exceptions import ProgrammingError
+from crate.qa.tests import WAIT_SOURCES, ShardGroup, wait_for, shards_started, \
+    recoveries_done, health_of, health_reached, nodes_joined, master_elected
+
+
+def group(table, primary, state, count=1, stage='DONE', routing_state=None):
+    return ShardGroup('doc', table, primary, state, routing_state or state, stage, count)
+
+
+class FakeCursor:
+    """Cursor that answers the statements of `WAIT_SOURCES`.
+
+    `polls` maps a source to a list of results, one per poll; the last one
+    is repeated. A result that is an exception is raised by `execute`.
+    """
+
+    def __init__(self, **polls):
+        self.polls = polls
+        self.executed = []
+        self._rows = None
+
+    def execute(self, stmt):
+        source = next(s for s, (source_stmt, _) in WAIT_SOURCES.items() if source_stmt == stmt)
+        self.executed.append(source)
+        results = self.polls[source]
+        result = results.pop(0) if len(results) > 1 else results[0]
+        if isinstance(result, Exception):
+            raise result
+        self._rows = result
+
+    def fetchall(self):
+        return self._rows
+
+
+class ConditionTest(unittest.TestCase):
+
+    def test_shards_started(self):
+        groups = [group('t1', True, 'STARTED', 2), group('t1', False, 'INITIALIZING', 2),
+                  group('t2', True, 'STARTED', 3)]
+        self.assertTrue(shards_started(5).predicate(groups))
+        self.assertFalse(shards_started(7).predicate(groups))
+        self.assertFalse(shards_started().predicate(groups))
+        self.assertTrue(shards_started(table='t2').predicate(groups))
+        self.assertFalse(shards_started(table='t3').predicate(groups))
+        self.assertTrue(shards_started().predicate([]))
+
+    def test_recoveries_done(self):
+        self.assertTrue(recoveries_done().predicate([group('t1', True, 'STARTED')]))
+        self.assertFalse(recoveries_done().predicate(
+            [group('t1', True, 'STARTED'), group('t1', False, 'STARTED', stage='TRANSLOG')]))
+
+    def test_health_of(self):
+        self.assertEqual(health_of([]), 'GREEN')
+        self.assertEqual(health_of([group('t1', True, 'STARTED')]), 'GREEN')
+        self.assertEqual(health_of(
+            [group('t1', True, 'STARTED'), group('t1', False, 'UNASSIGNED')]), 'YELLOW')
+        self.assertEqual(health_of(
+            [group('t1', True, 'INITIALIZING'), group('t1', False, 'UNASSIGNED')]), 'RED')
+
+    def test_health_reached(self):
+        yellow = [group('t1', True, 'STARTED', 2), group('t1', False, 'UNASSIGNED', 2)]
+        self.assertTrue(health_reached('YELLOW').predicate(yellow))
+        self.assertFalse(health_reached('GREEN').predicate(yellow))
+        self.assertTrue(health_reached('GREEN').predicate([]))
+        self.assertFalse(health_reached('GREEN', min_shards=2).predicate([]))
+        self.assertTrue(health_reached('YELLOW', min_shards=4).predicate(yellow))
+
+
+class WaitForTest(unittest.TestCase):
+
+    def test_polls_until_all_conditions_are_met(self):
+        cursor = FakeCursor(
+            nodes=[[], [('a', 'n1', '4.0.0')], [('a', 'n1', '4.0.0'), ('b', 'n2', '4.0.0')]],
+            cluster=[ProgrammingError('not ready'), [('crate', 'a')]],
+        )
+        result = wait_for(cursor, nodes_joined(2), master_elected(), min_interval=0.001)
+        self.assertEqual(result.polls, 3)
+        self.assertEqual(cursor.executed, ['nodes', 'cluster'] * 3)
+
+    def test_timeout_is_caused_by_the_last_error(self):
+        error = ProgrammingError('Column foo unknown')
+        cursor = FakeCursor(shards=[error])
+        with self.assertRaises(TimeoutError) as cm:
+            wait_for(cursor, shards_started(), timeout=0.05, min_interval=0.001)
+        self.assertIs(cm.exception.__cause__, error)
+
+    def test_timeout_without_error(self):
+        cursor = FakeCursor(shards=[[group('t1', True, 'INITIALIZING')]])
+        with self.assertRaises(TimeoutError) as cm:
+            wait_for(cursor, shards_started(), timeout=0.05, min_interval=0.001)
+        self.assertIsNone(cm.exception.__cause__)
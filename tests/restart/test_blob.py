@@ -10,8 +10,7 @@ from crate.qa.tests import NodeProvider, wait_for_active_shards
 class BlobTestCase(NodeProvider, unittest.TestCase):
 
     def test_blob_index(self):
-        (node, _) = self._new_node(self.CRATE_VERSION)
-        node.start()
+        node = self._claim_node(self.CRATE_VERSION)
         with connect(node.http_url, error_trace=True) as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -36,8 +35,7 @@ class BlobTestCase(NodeProvider, unittest.TestCase):
             self.assertEqual(result[2], '0')
 
     def test_blob_record(self):
-        (node, _) = self._new_node(self.CRATE_VERSION)
-        node.start()
+        node = self._claim_node(self.CRATE_VERSION)
         digest = ''
         with connect(node.http_url, error_trace=True) as conn:
             cursor = conn.cursor()
@@ -62,5 +60,5 @@ class BlobTestCase(NodeProvider, unittest.TestCase):
             result = blob_container.get(digest)
             self.assertTrue(blob_container.exists(digest))
             self.assertEqual(next(result), b'sample data')
-            filepath = Path(self._path_data).glob(f'**/{digest}')
+            filepath = Path(node.data_path).glob(f'**/{digest}')
             self.assertTrue(next(filepath).exists())
@@ -13,8 +13,7 @@ class MetadataTestCase(NodeProvider, unittest.TestCase):
     }
 
     def test_udf(self):
-        (node, _) = self._new_node(self.CRATE_VERSION, settings=self.CRATE_SETTINGS)
-        node.start()
+        node = self._claim_node(self.CRATE_VERSION, self.CRATE_SETTINGS)
         with connect(node.http_url, error_trace=True) as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -36,8 +35,7 @@ class MetadataTestCase(NodeProvider, unittest.TestCase):
             self.assertEqual(result[0], 'subtract')
 
     def test_user_information(self):
-        (node, _) = self._new_node(self.CRATE_VERSION, settings=self.CRATE_SETTINGS)
-        node.start()
+        node = self._claim_node(self.CRATE_VERSION, self.CRATE_SETTINGS)
         with connect(node.http_url, error_trace=True) as conn:
             cursor = conn.cursor()
             cursor.execute("CREATE USER user_a")
@@ -55,8 +53,7 @@ class MetadataTestCase(NodeProvider, unittest.TestCase):
             self.assertFalse(result[1][1])
 
     def test_user_privileges(self):
-        (node, _) = self._new_node(self.CRATE_VERSION, settings=self.CRATE_SETTINGS)
-        node.start()
+        node = self._claim_node(self.CRATE_VERSION, self.CRATE_SETTINGS)
         with connect(node.http_url, error_trace=True) as conn:
             cursor = conn.cursor()
             cursor.execute("CREATE USER user_a")
@@ -87,8 +84,7 @@ class MetadataTestCase(NodeProvider, unittest.TestCase):
             self.assertEqual(result, expected)
 
     def test_ingestion_rules(self):
-        (node, _) = self._new_node(self.CRATE_VERSION, settings=self.CRATE_SETTINGS)
-        node.start()
+        node = self._claim_node(self.CRATE_VERSION, self.CRATE_SETTINGS)
         with connect(node.http_url, error_trace=True) as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -119,8 +115,7 @@ class MetadataTestCase(NodeProvider, unittest.TestCase):
             self.assertEqual(result, expected)
 
     def test_views(self):
-        (node, _) = self._new_node(self.CRATE_VERSION, settings=self.CRATE_SETTINGS)
-        node.start()
+        node = self._claim_node(self.CRATE_VERSION, self.CRATE_SETTINGS)
         with connect(node.http_url, error_trace=True) as conn:
             cursor = conn.cursor()
             cursor.execute("""